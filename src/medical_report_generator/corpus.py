@@ -0,0 +1,66 @@
+"""
+Helpers to read the labeled report corpus under `knowledge/reports/`.
+
+A report's type is taken from its sub-folder when the corpus is organised by
+type (`training/irm_genou/001.txt`), otherwise from its file name without the
+trailing index (`training/irm_genou_001.txt` -> `irm_genou`).
+"""
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+_TRAILING_INDEX = re.compile(r"[_\-\s]*\(?\d+\)?$")
+
+
+def normalize_report_type(report_type: str) -> str:
+    """Normalize a report type identifier (lowercase, no accents, underscores)."""
+    text = unicodedata.normalize("NFKD", report_type.strip().lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_")
+
+
+def report_type_from_path(path: Path, corpus_root: Path) -> str:
+    """Return the report type label of a corpus file."""
+    relative = Path(path).relative_to(corpus_root)
+    if len(relative.parts) > 1:
+        return normalize_report_type(relative.parts[0])
+    return normalize_report_type(_TRAILING_INDEX.sub("", relative.stem) or relative.stem)
+
+
+def iter_corpus_files(corpus_root: Path) -> Iterator[Path]:
+    """Yield the `.txt` reports of a corpus folder, in a stable order."""
+    corpus_root = Path(corpus_root)
+    if not corpus_root.exists():
+        return
+    yield from sorted(corpus_root.rglob("*.txt"))
+
+
+def load_labeled_corpus(corpus_root: Path) -> Tuple[List[str], List[str], List[Path]]:
+    """
+    Read every report of a corpus folder with its type label.
+
+    Returns:
+        tuple: (texts, labels, paths), skipping empty or unreadable files.
+    """
+    corpus_root = Path(corpus_root)
+    texts, labels, paths = [], [], []
+    for path in iter_corpus_files(corpus_root):
+        try:
+            text = path.read_text(encoding="utf-8").strip()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Avertissement : impossible de lire {path} ({e})")
+            continue
+        if not text:
+            continue
+        texts.append(text)
+        labels.append(report_type_from_path(path, corpus_root))
+        paths.append(path)
+    return texts, labels, paths
+
+
+def count_by_type(labels: List[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    return dict(sorted(counts.items()))
@@ -0,0 +1,251 @@
+"""
+Packed, memory-mapped storage of the retrieval knowledge base.
+
+Each `pack` writes a new build to `builds/<build>/`, holding for each report type:
+
+- `<type>.blob`: the names and texts of the reports, concatenated in UTF-8;
+- `<type>.meta.npy`: one record per report (offsets into the blob, cluster id
+  and size from the near-duplicate pass);
+- `<type>.tfidf.{data,indices,indptr}.npy`: the TF-IDF matrix of the texts, and
+  `<type>.vectorizer.joblib` the fitted vectorizer.
+
+`manifest.json` names the current build and is replaced atomically once the
+build is complete. Builds are never modified afterwards, so a process still
+reading the previous build keeps a consistent view until it reopens the corpus.
+
+Blobs and arrays are memory-mapped read-only, so every process on a host
+shares the same pages, and a report's text is only decoded when it is returned.
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from medical_report_generator.corpus import load_labeled_corpus
+from medical_report_generator.dedup import find_near_duplicate_clusters
+
+MANIFEST_NAME = "manifest.json"
+BUILDS_DIR_NAME = "builds"
+FORMAT_VERSION = 2
+# Builds kept on disk: the current one and the previous one, which processes
+# that have not reopened the corpus yet may still be reading
+KEPT_BUILDS = 2
+
+META_DTYPE = np.dtype([
+    ("name_offset", "<u8"),
+    ("name_length", "<u4"),
+    ("text_offset", "<u8"),
+    ("text_length", "<u4"),
+    ("cluster_id", "<i4"),
+    ("cluster_size", "<u4"),
+])
+
+
+def _write_atomic(path: Path, write):
+    """Write a file through `write(file_object)` into a temp file renamed over `path`."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        os.chmod(tmp_name, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def pack_corpus(
+    corpus_root: Path,
+    output_dir: Path,
+    stop_words: Optional[Sequence[str]] = None,
+    dedup_threshold: Optional[float] = 0.8,
+) -> dict:
+    """
+    Build the packed corpus of a labeled report folder.
+
+    Args:
+        corpus_root: Folder of labeled reports (e.g. `knowledge/reports/training`).
+        output_dir: Destination folder of the packed corpus.
+        stop_words: Stop words of the TF-IDF vectorizer.
+        dedup_threshold: Near-duplicate threshold; only one representative per
+            cluster is packed. None disables deduplication.
+
+    Returns:
+        dict: The manifest written to `output_dir`.
+    """
+    corpus_root, output_dir = Path(corpus_root), Path(output_dir)
+    builds_dir = output_dir / BUILDS_DIR_NAME
+    builds_dir.mkdir(parents=True, exist_ok=True)
+    texts, labels, paths = load_labeled_corpus(corpus_root)
+
+    if dedup_threshold is not None:
+        clusters = find_near_duplicate_clusters(texts, groups=labels, threshold=dedup_threshold)
+    else:
+        clusters = [[i] for i in range(len(texts))]
+
+    built_at = datetime.now()
+    build_dir = Path(tempfile.mkdtemp(dir=builds_dir, prefix=built_at.strftime("%Y-%m-%d-%H-%M-%S_")))
+    os.chmod(build_dir, 0o755)
+    manifest = {
+        "version": FORMAT_VERSION,
+        "build": build_dir.name,
+        "built_at": built_at.isoformat(timespec="seconds"),
+        "source": str(corpus_root.resolve()),
+        "dedup_threshold": dedup_threshold,
+        "n_source_reports": len(texts),
+    }
+    try:
+        manifest["types"] = _write_build(build_dir, corpus_root, texts, labels, paths, clusters, stop_words)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    # Switching the manifest publishes the build in one step
+    _write_atomic(
+        output_dir / MANIFEST_NAME,
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")),
+    )
+    _open_packed_corpus.cache_clear()
+    builds = sorted((p for p in builds_dir.iterdir() if p.is_dir()), key=lambda p: p.stat().st_mtime_ns)
+    for old_build in builds[:-KEPT_BUILDS]:
+        if old_build != build_dir:
+            shutil.rmtree(old_build, ignore_errors=True)
+    return manifest
+
+
+def _write_build(build_dir: Path, corpus_root: Path, texts, labels, paths, clusters, stop_words) -> dict:
+    """Write the files of every report type into `build_dir` and return their manifest entries."""
+    types = {}
+    by_type: Dict[str, List[Tuple[int, int, int]]] = {}
+    for cluster_id, members in enumerate(clusters):
+        representative = members[0]
+        by_type.setdefault(labels[representative], []).append((representative, cluster_id, len(members)))
+
+    for report_type, entries in sorted(by_type.items()):
+        meta = np.zeros(len(entries), dtype=META_DTYPE)
+        chunks, offset = [], 0
+        for row, (i, cluster_id, cluster_size) in enumerate(entries):
+            name = str(paths[i].relative_to(corpus_root)).encode("utf-8")
+            text = texts[i].encode("utf-8")
+            meta[row] = (offset, len(name), offset + len(name), len(text), cluster_id, cluster_size)
+            chunks.extend((name, text))
+            offset += len(name) + len(text)
+
+        # float32 like the stored matrix, so that queries never upcast the mapped data
+        vectorizer = TfidfVectorizer(stop_words=stop_words, dtype=np.float32)
+        matrix = vectorizer.fit_transform([texts[i] for i, _, _ in entries]).tocsr()
+        matrix.sort_indices()
+
+        _write_atomic(build_dir / f"{report_type}.blob", lambda f: f.writelines(chunks))
+        _write_atomic(build_dir / f"{report_type}.meta.npy", lambda f: np.save(f, meta))
+        for part in ("data", "indices", "indptr"):
+            array = getattr(matrix, part)
+            array = array.astype(np.float32 if part == "data" else np.int32)
+            _write_atomic(build_dir / f"{report_type}.tfidf.{part}.npy", lambda f: np.save(f, array))
+        _write_atomic(build_dir / f"{report_type}.vectorizer.joblib", lambda f: joblib.dump(vectorizer, f))
+
+        types[report_type] = {
+            "n_reports": len(entries),
+            "n_features": matrix.shape[1],
+            "blob_bytes": offset,
+        }
+    return types
+
+
+class PackedReportSet:
+    """Memory-mapped reports of one type."""
+
+    def __init__(self, directory: Path, report_type: str, n_features: int):
+        self.report_type = report_type
+        with open(directory / f"{report_type}.blob", "rb") as f:
+            # mmap cannot map an empty file
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.meta = np.load(directory / f"{report_type}.meta.npy", mmap_mode="r")
+        data, indices, indptr = (
+            np.load(directory / f"{report_type}.tfidf.{part}.npy", mmap_mode="r")
+            for part in ("data", "indices", "indptr")
+        )
+        self.matrix = csr_matrix((data, indices, indptr), shape=(len(self.meta), n_features), copy=False)
+        self.vectorizer: TfidfVectorizer = joblib.load(directory / f"{report_type}.vectorizer.joblib")
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Cosine similarity of the query with every report (TF-IDF rows are L2-normalized)."""
+        query_vector = self.vectorizer.transform([query]).astype(self.matrix.dtype, copy=False)
+        return np.asarray((self.matrix @ query_vector.T).todense()).ravel()
+
+    def _decode(self, offset, length) -> str:
+        return bytes(self._blob[int(offset):int(offset) + int(length)]).decode("utf-8")
+
+    def name(self, i: int) -> str:
+        record = self.meta[i]
+        return self._decode(record["name_offset"], record["name_length"])
+
+    def text(self, i: int) -> str:
+        record = self.meta[i]
+        return self._decode(record["text_offset"], record["text_length"])
+
+
+class PackedCorpus:
+    """
+    Read-only view over the current build of a packed corpus folder.
+
+    Report types are opened lazily, always from the build named by the manifest
+    read at construction, so a concurrent `pack` never mixes files of two builds.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest = json.loads((self.directory / MANIFEST_NAME).read_text(encoding="utf-8"))
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Version de corpus compacté non supportée : {self.manifest.get('version')} "
+                "(relancez la commande pack)"
+            )
+        self.build_dir = self.directory / BUILDS_DIR_NAME / self.manifest["build"]
+        self._sets: Dict[str, PackedReportSet] = {}
+
+    @property
+    def report_types(self) -> List[str]:
+        return list(self.manifest["types"])
+
+    def get(self, report_type: str) -> PackedReportSet:
+        if report_type not in self._sets:
+            info = self.manifest["types"][report_type]
+            self._sets[report_type] = PackedReportSet(self.build_dir, report_type, info["n_features"])
+        return self._sets[report_type]
+
+
+@lru_cache(maxsize=4)
+def _open_packed_corpus(directory: str, manifest_mtime_ns: int) -> PackedCorpus:
+    return PackedCorpus(Path(directory))
+
+
+def open_packed_corpus(directory: Path) -> Optional[PackedCorpus]:
+    """
+    Return the packed corpus of `directory`, or None if it has not been built.
+
+    The corpus is opened once per process (and reopened if it is rebuilt), so
+    all tool instances share the same mappings.
+    """
+    manifest_path = Path(directory) / MANIFEST_NAME
+    try:
+        mtime_ns = manifest_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _open_packed_corpus(str(Path(directory).resolve()), mtime_ns)
@@ -0,0 +1,188 @@
+"""
+Near-duplicate detection for the report knowledge base with MinHash and LSH.
+
+Each report is reduced to a MinHash signature of its word shingles. Signatures
+are split into bands and hashed into buckets (locality-sensitive hashing), so
+only reports sharing a bucket are compared. Candidate pairs whose estimated
+Jaccard similarity reaches the threshold are merged into clusters, and the
+most complete report of each cluster is kept as its representative.
+"""
+import re
+import shutil
+import unicodedata
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from medical_report_generator.corpus import load_labeled_corpus
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Return the hashed word `size`-grams of a text (a single one for short texts)."""
+    words = _normalize(text).split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {
+        zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    }
+
+
+def lsh_parameters(threshold: float, num_perm: int, min_recall: float = 0.99) -> Tuple[int, int]:
+    """
+    Choose (bands, rows) so that pairs at `threshold` become candidates with
+    probability at least `min_recall`.
+
+    A pair of similarity s shares a bucket with probability 1 - (1 - s^r)^b.
+    Candidates are checked against the full signature afterwards, so extra
+    candidates only cost comparisons while missed ones are lost duplicates:
+    the S-curve is placed well below the threshold, with as many rows per
+    band as the recall target allows.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1.0 - (1.0 - threshold ** rows) ** bands < min_recall:
+            break
+        best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash signatures with `num_perm` universal hash permutations."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str, shingle_size: int = 5) -> np.ndarray:
+        values = np.fromiter(shingles(text, shingle_size), dtype=np.uint64)
+        # (a * x + b) mod p, truncated to 32 bits, for every permutation at once
+        hashed = (np.outer(values, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=0).astype(np.uint32)
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def find_near_duplicate_clusters(
+    texts: Sequence[str],
+    groups: Sequence[str] = None,
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+) -> List[List[int]]:
+    """
+    Cluster near-duplicate texts.
+
+    Args:
+        texts: Report texts.
+        groups: Optional group of each text (e.g. report type); texts of
+            different groups are never clustered together.
+        threshold: Minimum estimated Jaccard similarity of two duplicates.
+        num_perm: Number of MinHash permutations.
+        shingle_size: Number of words per shingle.
+
+    Returns:
+        list: Clusters as lists of indices into `texts`, the representative
+        (longest text) first; singletons are included.
+    """
+    if not texts:
+        return []
+    groups = list(groups) if groups is not None else [""] * len(texts)
+    hasher = MinHasher(num_perm)
+    signatures = np.stack([hasher.signature(text, shingle_size) for text in texts])
+    bands, rows = lsh_parameters(threshold, num_perm)
+
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    for i, signature in enumerate(signatures):
+        for band in range(bands):
+            key = (groups[i], band, signature[band * rows:(band + 1) * rows].tobytes())
+            buckets[key].append(i)
+
+    union_find = _UnionFind(len(texts))
+    checked = set()
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                if (i, j) in checked or union_find.find(i) == union_find.find(j):
+                    continue
+                checked.add((i, j))
+                if np.mean(signatures[i] == signatures[j]) >= threshold:
+                    union_find.union(i, j)
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[union_find.find(i)].append(i)
+    return [
+        sorted(members, key=lambda i: (-len(texts[i]), i))
+        for members in sorted(clusters.values(), key=lambda m: m[0])
+    ]
+
+
+def deduplicate_corpus(corpus_root: Path, threshold: float = 0.8, duplicates_dir: Optional[Path] = None) -> dict:
+    """
+    Cluster the near-duplicate reports of a corpus folder.
+
+    Args:
+        corpus_root: Folder of labeled reports (e.g. `knowledge/reports/training`).
+        threshold: Minimum estimated Jaccard similarity of two duplicates.
+        duplicates_dir: If given, non-representative reports are moved there
+            (keeping their path relative to `corpus_root`).
+
+    Returns:
+        dict: Manifest with one entry per cluster of two or more reports.
+    """
+    corpus_root = Path(corpus_root)
+    texts, labels, paths = load_labeled_corpus(corpus_root)
+    clusters = find_near_duplicate_clusters(texts, groups=labels, threshold=threshold)
+    duplicate_clusters = []
+    for members in clusters:
+        if len(members) < 2:
+            continue
+        representative = paths[members[0]].relative_to(corpus_root)
+        duplicates = [paths[i].relative_to(corpus_root) for i in members[1:]]
+        duplicate_clusters.append({
+            "report_type": labels[members[0]],
+            "representative": str(representative),
+            "count": len(members),
+            "duplicates": [str(d) for d in duplicates],
+        })
+        if duplicates_dir is not None:
+            for duplicate in duplicates:
+                target = Path(duplicates_dir) / duplicate
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(corpus_root / duplicate), str(target))
+    return {
+        "threshold": threshold,
+        "n_reports": len(texts),
+        "n_clusters": len(clusters),
+        "clusters": duplicate_clusters,
+    }
@@ -1,261 +1,31 @@
 #!/usr/bin/env python
 import sys
 import warnings
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import re
 import random
 from pathlib import Path
 from datetime import datetime
+import json
 
 from medical_report_generator.crew import MedicalReportGenerator
+from medical_report_generator.corpus_store import pack_corpus
+from medical_report_generator.dedup import deduplicate_corpus
+from medical_report_generator.preprocessing import PreprocessResult, preprocess_dictation
+from medical_report_generator.profiling import ProfileSession, instrument_crew, span
+# Document helpers live in rendering.py; they are kept importable from main
+from medical_report_generator.rendering import (
+    ReportRenderer,
+    build_document_from_scratch,
+    create_word_document_from_template,
+    parse_report_sections,
+    replace_template_placeholders,
+)
+from medical_report_generator.tools.rag_tool import FRENCH_STOPWORDS
+from medical_report_generator.training import train_report_classifier
+from medical_report_generator.watcher import DictationWatcher
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
 
-def create_word_document_from_template(report_text: str, template_path: str = None, filename: str = "radiology_report.docx"):
-    """
-    Creates a Word document from the structured report text using a template.
-    
-    Args:
-        report_text: The complete structured report text (output from the crew).
-        template_path: Path to the template .docx file. If None, creates from scratch.
-        filename: The name of the output .docx file.
-    """
-    
-    # Load template or create new document
-    if template_path and Path(template_path).exists():
-        print(f"Using template: {template_path}")
-        document = Document(template_path)
-    else:
-        print("Creating document from scratch (template not found or not specified)")
-        document = Document()
-        # Set default style
-        style = document.styles["Normal"] 
-        font = style.font
-        font.name = "Calibri"
-        font.size = Pt(11)
-
-    # Parse the report text to extract sections
-    parsed_sections = parse_report_sections(report_text)
-    
-    if template_path and Path(template_path).exists():
-        # Method 1: Replace placeholders in template
-        replace_template_placeholders(document, parsed_sections)
-    else:
-        # Method 2: Build document from scratch (your original method)
-        build_document_from_scratch(document, parsed_sections)
-
-    try:
-        document.save(filename)
-        print(f"\nCompte rendu généré avec succès sous le nom '{filename}'")
-        return {"is_generated": True, "filename": filename}
-    except Exception as e:
-        print(f"\nErreur lors de l'enregistrement du document : {e}")
-        return {"is_generated": False, "error": str(e)}
-
-
-def parse_report_sections(report_text: str) -> dict:
-    """
-    Parse the report text and extract all sections.
-    
-    Args:
-        report_text: The complete structured report text
-        
-    Returns:
-        dict: Dictionary with section names as keys and content as values
-    """
-    # Clean up markdown code blocks
-    cleaned_text = re.sub(
-        r"^\s*```(?:json|text|french)?\s*[\r\n]*(.*?)\s*```\s*$",
-        r"\1",
-        report_text,
-        flags=re.DOTALL | re.IGNORECASE,
-    ).strip()
-
-    lines = cleaned_text.split("\n")
-    
-    # Extract title
-    title_content = "Compte Rendu Radiologique"
-    lines_for_sections = lines
-    
-    if lines:
-        first_line = lines[0].strip()
-        if first_line.upper().startswith("TITRE:"):
-            title_content = (
-                first_line.split(":", 1)[1].strip()
-                if ":" in first_line
-                else title_content
-            )
-            lines_for_sections = lines[1:]
-
-    # Parse sections
-    section_headers_list = [
-        "Indication:",
-        "Technique:", 
-        "Incidences:",
-        "Résultat:",
-        "Conclusion:",
-    ]
-    
-    sections = {"TITRE": title_content}
-    current_section_header = None
-    current_section_content = []
-
-    for line_idx, line_text in enumerate(lines_for_sections):
-        stripped_line = line_text.strip()
-        found_new_header = False
-        
-        for header in section_headers_list:
-            if stripped_line.upper().startswith(header.upper()):
-                if current_section_header:
-                    sections[current_section_header.rstrip(":")] = "\n".join(
-                        current_section_content
-                    ).strip()
-                current_section_header = header
-                current_section_content = [stripped_line[len(header):].strip()]
-                found_new_header = True
-                break
-                
-        if not found_new_header and current_section_header:
-            if stripped_line:
-                current_section_content.append(stripped_line)
-
-        if line_idx == len(lines_for_sections) - 1 and current_section_header:
-            sections[current_section_header.rstrip(":")] = "\n".join(
-                current_section_content
-            ).strip()
-
-    # Ensure all required sections exist
-    for header in section_headers_list:
-        section_name = header.rstrip(":")
-        if section_name not in sections:
-            sections[section_name] = ""
-
-    return sections
-
-
-def replace_template_placeholders(document, sections):
-    """
-    Replace placeholders in the template document with actual content.
-    
-    This method looks for placeholders like {{TITRE}}, {{Indication}}, etc.
-    and replaces them with the actual content.
-    """
-    # Get current date in French format
-    current_date = datetime.now().strftime("%A %d %B %Y")
-    # Define placeholder mappings - including all possible variations
-    placeholder_mappings = {
-        "{{DATE}}": current_date,
-        "{{ DATE }}": current_date,
-        "{{TITRE}}": sections.get("TITRE", "Compte Rendu Radiologique"),
-        "{{ TITRE }}": sections.get("TITRE", "Compte Rendu Radiologique"),
-        "{{Indication}}": sections.get("Indication", "Néant"),
-        "{{ Indication }}": sections.get("Indication", "Néant"),
-        "{{Technique}}": sections.get("Technique", "Néant"),
-        "{{ Technique }}": sections.get("Technique", "Néant"),
-        "{{Incidences}}": sections.get("Incidences", "Néant"),
-        "{{ Incidences }}": sections.get("Incidences", "Néant"),
-        "{{Résultat}}": sections.get("Résultat", "Néant"),
-        "{{ Résultat }}": sections.get("Résultat", "Néant"),
-        "{{Resultat}}": sections.get("Résultat", "Néant"),  # without accent
-        "{{ Resultat }}": sections.get("Résultat", "Néant"),  # without accent
-        "{{Conclusion}}": sections.get("Conclusion", "Néant"),
-        "{{ Conclusion }}": sections.get("Conclusion", "Néant"),
-        "{{Conclusions}}": sections.get("Conclusion", "Néant"),  # plural form
-        "{{ Conclusions }}": sections.get("Conclusion", "Néant"),  # plural form
-        "{{USER}}": "Medical Agent Reporter",  # plural form
-    }
-    
-    # Debug: Print available sections
-    print(f"\nDEBUG - Available sections: {list(sections.keys())}")
-    for key, value in sections.items():
-        print(f"  {key}: {value[:100]}..." if len(str(value)) > 100 else f"  {key}: {value}")
-    
-    # Function to replace text in paragraph while preserving formatting
-    def replace_in_paragraph(paragraph, placeholder, replacement):
-        if placeholder in paragraph.text:
-            print(f"DEBUG - Found placeholder '{placeholder}' in paragraph")
-            
-            # Method 1: Try to replace in individual runs first
-            replaced = False
-            for run in paragraph.runs:
-                if placeholder in run.text:
-                    run.text = run.text.replace(placeholder, replacement or "Néant")
-                    replaced = True
-                    print(f"DEBUG - Replaced '{placeholder}' in run")
-            
-            # Method 2: If not replaced in runs, rebuild paragraph
-            if not replaced and placeholder in paragraph.text:
-                print(f"DEBUG - Rebuilding paragraph for '{placeholder}'")
-                full_text = paragraph.text
-                new_text = full_text.replace(placeholder, replacement or "Néant")
-                
-                # Clear paragraph and add new text
-                paragraph.clear()
-                paragraph.add_run(new_text)
-    
-    # Replace placeholders in paragraphs
-    for paragraph in document.paragraphs:
-        original_text = paragraph.text
-        for placeholder, content in placeholder_mappings.items():
-            replace_in_paragraph(paragraph, placeholder, content)
-        
-        # Log if paragraph changed
-        if paragraph.text != original_text:
-            print(f"DEBUG - Paragraph changed from: '{original_text[:50]}...' to: '{paragraph.text[:50]}...'")
-    
-    # Replace placeholders in tables (if your template has tables)
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for placeholder, content in placeholder_mappings.items():
-                        replace_in_paragraph(paragraph, placeholder, content)
-
-    # Replace placeholders in headers and footers
-    for section in document.sections:
-        # Header
-        if section.header:
-            for paragraph in section.header.paragraphs:
-                for placeholder, content in placeholder_mappings.items():
-                    replace_in_paragraph(paragraph, placeholder, content)
-        
-        # Footer
-        if section.footer:
-            for paragraph in section.footer.paragraphs:
-                for placeholder, content in placeholder_mappings.items():
-                    replace_in_paragraph(paragraph, placeholder, content)
-
-
-def build_document_from_scratch(document, sections):
-    """
-    Build the document from scratch (original method).
-    """
-    # Add title
-    title_paragraph = document.add_paragraph(sections.get("TITRE", "Compte Rendu Radiologique"))
-    title_paragraph.style = document.styles["Heading 1"]
-    title_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-    document.add_paragraph()  # Add a blank line after the title
-
-    # Add sections in order
-    section_headers_list = ["Indication", "Technique", "Incidences", "Résultat", "Conclusion"]
-    
-    for header in section_headers_list:
-        content = sections.get(header, "").strip()
-        paragraph = document.add_paragraph()
-        header_run = paragraph.add_run(f"{header}:")
-        header_run.bold = True
-        paragraph.add_run(" ")
-
-        if content and content != "-" and content.upper() != "NÉANT":
-            paragraph.add_run(content)
-        else:
-            paragraph.add_run("Néant")
-        document.add_paragraph()
-
-
 # def run(medical_input: str = None):
 #     """
 #     Run the crew to generate a medical report using template.
@@ -334,13 +104,17 @@ def build_document_from_scratch(document, sections):
 
 
 
-def run(input_file: str = None):
+def run(input_file: str = None, max_chunk_tokens: int = None, profile: bool = None):
     """
     Run the crew to generate a medical report using template.
     
     Args:
         input_file: Path to the input text file containing medical data.
         If None, will look for files in input_data folder.
+        max_chunk_tokens: If set, inputs longer than this many tokens are split
+        into one report per examination (defaults to MAX_INPUT_TOKENS).
+        profile: If True, profile the run and write the profile next to the report.
+        Defaults to whether --profile is on the command line (for the run_crew script).
     """
     print("## Équipe de Génération de Compte Rendu Médical")
     print("-------------------------------")
@@ -385,14 +159,14 @@ def run(input_file: str = None):
     # Read the input file
     try:
         print(f"Lecture du fichier d'entrée : {input_file_path.name}")
-        with open(input_file_path, "r", encoding="utf-8") as f:
-            raw_medical_input = f.read().strip()
-        
-        if not raw_medical_input:
+        # Read as bytes: the encoding is repaired by the preprocessing stage
+        with open(input_file_path, "rb") as f:
+            raw_medical_input = f.read()
+
+        preprocessed = preprocess_input(raw_medical_input, max_chunk_tokens)
+        if not preprocessed.text:
             print("Erreur : Le fichier d'entrée est vide.")
             sys.exit(1)
-            
-        print(f"Données médicales chargées ({len(raw_medical_input)} caractères)")
         
     except FileNotFoundError:
         print(f"Erreur : Fichier non trouvé : {input_file_path}")
@@ -401,66 +175,357 @@ def run(input_file: str = None):
         print(f"Erreur lors de la lecture du fichier : {e}")
         sys.exit(1)
 
+    if profile is None:
+        profile = "--profile" in sys.argv[1:]
+    session = ProfileSession() if profile else None
+    if session is not None:
+        session.start()
+
+    # Instantiate the Crew and generate the report
+    status = None
+    try:
+        status = generate_reports(preprocessed, input_file_path.name, project_root)
+        return status
+
+    except Exception as e:
+        print(
+            f"\nUne erreur s'est produite lors de l'exécution de l'équipe ou de la génération du document : {type(e).__name__}: {e}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    finally:
+        if session is not None:
+            _finish_profile(session, project_root, status, input_file_path.stem)
+
+
+def _finish_profile(session: ProfileSession, project_root: Path, status: dict = None, name: str = "run"):
+    """
+    Stop a profiling session and write its files next to the generated report,
+    or to generated/profiles/ if no report was generated.
+    """
+    session.stop()
+    report_path = None
+    if status and status.get("is_generated"):
+        report_path = (status.get("filenames") or [status.get("filename")])[0]
+    if report_path:
+        output_prefix = project_root / Path(report_path).with_suffix("")
+    else:
+        output_prefix = project_root / "generated" / "profiles" / datetime.now().strftime(
+            f"profile_{name}_%Y-%m-%d-%H-%M-%S"
+        )
+    print("\n" + session.summary().split("\n\n## Top")[0])
+    for path in session.write(output_prefix):
+        print(f"Profil sauvegardé : {path}")
+
+
+def preprocess_input(raw_medical_input, max_chunk_tokens: int = None) -> PreprocessResult:
+    """
+    Normalize a raw dictation before the crew and print the token savings.
+
+    Args:
+        raw_medical_input: Raw input text (str or bytes).
+        max_chunk_tokens: Optional token budget above which the input is split
+            into exam-level chunks.
+    """
+    preprocessed = preprocess_dictation(raw_medical_input, max_chunk_tokens)
+    print(f"Données médicales chargées ({len(preprocessed.text)} caractères)")
+    print(
+        f"Tokens estimés : {preprocessed.tokens_before} -> {preprocessed.tokens_after} "
+        f"({preprocessed.tokens_saved} économisés par tâche utilisant l'entrée)"
+    )
+    if len(preprocessed.chunks) > 1:
+        print(f"Entrée découpée en {len(preprocessed.chunks)} examens")
+    return preprocessed
+
+
+def generate_reports(
+    preprocessed: PreprocessResult,
+    input_name: str,
+    project_root: Path = None,
+    renderer: ReportRenderer = None,
+) -> dict:
+    """
+    Generate one report per exam-level chunk of a preprocessed input.
+
+    Returns:
+        dict: The status of `generate_report` for a single chunk; for several
+        chunks, an aggregated status with the list of generated files.
+    """
+    if len(preprocessed.chunks) == 1:
+        return generate_report(preprocessed.chunks[0], input_name, project_root, renderer=renderer)
+
+    input_path = Path(input_name)
+    statuses = []
+    for i, chunk in enumerate(preprocessed.chunks, 1):
+        print(f"\n## Examen {i}/{len(preprocessed.chunks)}")
+        chunk_name = f"{input_path.stem}_examen{i}{input_path.suffix}"
+        statuses.append(generate_report(chunk, chunk_name, project_root, renderer=renderer))
+    errors = [s["error"] for s in statuses if not s["is_generated"]]
+    return {
+        "is_generated": not errors,
+        "filenames": [s["filename"] for s in statuses if s["is_generated"]],
+        "input_file": str(input_name),
+        "error": "; ".join(errors) if errors else None,
+    }
+
+
+def generate_report(
+    raw_medical_input: str,
+    input_name: str,
+    project_root: Path = None,
+    renderer: ReportRenderer = None,
+) -> dict:
+    """
+    Run the crew on one medical text and render the resulting .docx report.
+
+    Unlike `run`, this never prompts nor exits: errors are raised to the caller,
+    so it can be used from batch and daemon modes.
+
+    Args:
+        raw_medical_input: The raw medical text given to the crew.
+        input_name: Name of the input file, used in the output file name.
+        project_root: Project root folder. Defaults to the repository root.
+        renderer: Optional process pool used to render the .docx file, so the
+            calling thread does not hold the GIL during rendering.
+
+    Returns:
+        dict: The document generation status, with paths relative to the project root.
+    """
+    if project_root is None:
+        project_root = Path(__file__).resolve().parent.parent.parent
+
     # Define the inputs for the first task
     inputs = {
         "raw_input": raw_medical_input
     }
 
-    # Instantiate the Crew using the CrewBase class
-    try:
+    with span("crew:setup"):
         crew_generator = MedicalReportGenerator()
         crew = crew_generator.crew()
+    instrument_crew(crew)
 
-        # Kick off the crew process
-        print("\nDémarrage du processus de l'équipe...")
+    # Kick off the crew process
+    print("\nDémarrage du processus de l'équipe...")
+    with span("crew:kickoff"):
         result = str(crew.kickoff(inputs=inputs))
-        print("\nProcessus de l'équipe terminé.")
+    print("\nProcessus de l'équipe terminé.")
 
-        print("\n## Texte du Compte Rendu Généré:")
-        print(result)
-        print("-------------------------------")
+    print("\n## Texte du Compte Rendu Généré:")
+    print(result)
+    print("-------------------------------")
 
-        # Template path - adjust this to your template location
-        template_path = project_root / "templates" / "report_template.docx"
-        
-        # Output path with input file name reference
-        input_name = input_file_path.stem  # filename without extension
-        unique_name = datetime.now().strftime(f"report_{input_name}_%Y-%m-%d-%H-%M-%S.docx")
-        generated_report_path_absolute = project_root / "generated" / "reports" / unique_name
-        generated_report_path_relative = Path("generated") / "reports" / unique_name
-
-        # Ensure output directory exists
-        generated_report_path_absolute.parent.mkdir(parents=True, exist_ok=True)
-
-        # Generate the .docx file from the final report text using template
-        document_generation_status = create_word_document_from_template(
-            result, 
-            template_path=str(template_path),
-            filename=str(generated_report_path_absolute)
+    # Template path - adjust this to your template location
+    template_path = project_root / "templates" / "report_template.docx"
+
+    # Output path with input file name reference
+    input_stem = Path(input_name).stem  # filename without extension
+    unique_name = datetime.now().strftime(f"report_{input_stem}_%Y-%m-%d-%H-%M-%S.docx")
+    generated_report_path_absolute = project_root / "generated" / "reports" / unique_name
+    generated_report_path_relative = Path("generated") / "reports" / unique_name
+
+    # Ensure output directory exists
+    generated_report_path_absolute.parent.mkdir(parents=True, exist_ok=True)
+
+    # Generate the .docx file from the final report text using template
+    document_generation_status = create_word_document_from_template(
+        result,
+        template_path=str(template_path),
+        filename=str(generated_report_path_absolute),
+        renderer=renderer,
+    )
+
+    # If successful, replace the absolute path with the relative path string in the return value
+    if document_generation_status["is_generated"]:
+        document_generation_status["filename"] = str(generated_report_path_relative)
+        document_generation_status["input_file"] = str(input_name)
+
+    return document_generation_status
+
+
+def watch(max_workers: int = 2, settle_seconds: float = 2.0, poll_interval: float = 5.0):
+    """
+    Watch the input_data folder and generate a report for each new dictation.
+
+    Processed inputs are moved to input_data/done/ or input_data/failed/, and
+    input_data/.watch_state.json keeps track of them across restarts.
+
+    Args:
+        max_workers: Number of dictations processed concurrently.
+        settle_seconds: Delay without changes before a file is considered complete.
+        poll_interval: Folder scan interval when inotify is not available.
+    """
+    print("## Surveillance des Dictées Médicales")
+    print("-------------------------------")
+
+    project_root = Path(__file__).resolve().parent.parent.parent
+    input_data_folder = project_root / "input_data"
+
+    def process_file(input_file_path: Path) -> dict:
+        preprocessed = preprocess_input(input_file_path.read_bytes())
+        if not preprocessed.text:
+            return {"is_generated": False, "error": "Le fichier d'entrée est vide."}
+        return generate_reports(preprocessed, input_file_path.name, project_root, renderer=renderer)
+
+    # Documents are rendered in a separate process pool so that rendering does
+    # not slow down the crews running in the watcher threads
+    with ReportRenderer(max_workers=max_workers) as renderer:
+        watcher = DictationWatcher(
+            input_data_folder,
+            process_file,
+            max_workers=max_workers,
+            settle_seconds=settle_seconds,
+            poll_interval=poll_interval,
         )
+        watcher.serve_forever()
 
-        # If successful, replace the absolute path with the relative path string in the return value
-        if document_generation_status["is_generated"]:
-            document_generation_status["filename"] = str(generated_report_path_relative)
-            document_generation_status["input_file"] = str(input_file_path.name)
 
-        return document_generation_status
+# Keep the other functions as placeholders
+def train():
+    """Train the report type classifier on the labeled training corpus."""
+    print("## Entraînement du Classifieur de Type de Rapport")
+    print("-------------------------------")
 
-    except Exception as e:
-        print(
-            f"\nUne erreur s'est produite lors de l'exécution de l'équipe ou de la génération du document : {type(e).__name__}: {e}",
-            file=sys.stderr,
+    project_root = Path(__file__).resolve().parent.parent.parent
+    training_path = project_root / "knowledge" / "reports" / "training"
+    testing_path = project_root / "knowledge" / "reports" / "testing"
+    model_path = project_root / "knowledge" / "models" / "report_classifier.joblib"
+
+    if not training_path.exists():
+        print(f"Erreur : Le répertoire d'entraînement n'a pas été trouvé à {training_path}")
+        sys.exit(1)
+
+    try:
+        summary = train_report_classifier(
+            training_path,
+            model_path=model_path,
+            testing_path=testing_path if testing_path.exists() else None,
         )
+    except ValueError as e:
+        print(f"Erreur : {e}")
         sys.exit(1)
 
+    print(f"Rapports d'entraînement : {summary['n_train']}")
+    for label, count in summary["labels"].items():
+        print(f"  {label}: {count}")
+    print(f"Régularisation retenue : C={summary['C']} ({summary['training_seconds']}s)")
+    if "test_accuracy" in summary:
+        print(f"\nPrécision sur l'ensemble de test ({summary['n_test']} rapports) : {summary['test_accuracy']:.1%}")
+        print(summary["test_report"])
+    else:
+        print("\nAucun rapport de test trouvé, précision non évaluée.")
+    print(f"Modèle sauvegardé : {summary['model_path']}")
+    return summary
 
 
+def dedup(apply: bool = None, threshold: float = 0.8):
+    """
+    Detect near-duplicate reports in the training knowledge base.
 
-# Keep the other functions as placeholders
-def train():
-    """Train the crew for a given number of iterations."""
-    print("L'entraînement de l'équipe n'est pas complètement implémenté ou testé avec cette configuration LLM.")
-    print("Adjust the train function based on CrewAI and LLM provider documentation.")
+    Writes the clusters to knowledge/reports/dedup_clusters.json. With `apply`,
+    only one representative per cluster is kept in the training folder and the
+    others are moved to knowledge/reports/duplicates/.
+
+    Args:
+        apply: Move the duplicates out of the training folder.
+        Defaults to whether --apply is on the command line (for the dedup script).
+        threshold: Minimum estimated Jaccard similarity of two duplicates.
+    """
+    print("## Déduplication de la Base de Connaissances")
+    print("-------------------------------")
+
+    if apply is None:
+        apply = "--apply" in sys.argv[1:]
+
+    project_root = Path(__file__).resolve().parent.parent.parent
+    reports_path = project_root / "knowledge" / "reports"
+    training_path = reports_path / "training"
+    if not training_path.exists():
+        print(f"Erreur : Le répertoire d'entraînement n'a pas été trouvé à {training_path}")
+        sys.exit(1)
+
+    manifest = deduplicate_corpus(
+        training_path,
+        threshold=threshold,
+        duplicates_dir=reports_path / "duplicates" if apply else None,
+    )
+    manifest_path = reports_path / "dedup_clusters.json"
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    n_duplicates = sum(c["count"] - 1 for c in manifest["clusters"])
+    print(f"Rapports analysés : {manifest['n_reports']}")
+    print(f"Clusters distincts : {manifest['n_clusters']} ({n_duplicates} quasi-doublons)")
+    for cluster in sorted(manifest["clusters"], key=lambda c: -c["count"])[:10]:
+        print(f"  {cluster['count']} x {cluster['representative']}")
+    if apply:
+        print(f"Quasi-doublons déplacés vers : {reports_path / 'duplicates'}")
+    print(f"Clusters sauvegardés : {manifest_path}")
+    return manifest
+
+
+def pack(threshold: float = 0.8):
+    """
+    Build the packed, memory-mapped knowledge base used by the RAG tool.
+
+    The training reports are deduplicated and written to knowledge/reports/packed/
+    as one UTF-8 blob, a metadata array and a TF-IDF matrix per report type.
+    Run it again after changing knowledge/reports/training: the new build is
+    published atomically, running processes switch to it on their next query.
+    """
+    print("## Compactage de la Base de Connaissances")
+    print("-------------------------------")
+
+    project_root = Path(__file__).resolve().parent.parent.parent
+    reports_path = project_root / "knowledge" / "reports"
+    training_path = reports_path / "training"
+    if not training_path.exists():
+        print(f"Erreur : Le répertoire d'entraînement n'a pas été trouvé à {training_path}")
+        sys.exit(1)
+
+    packed_path = reports_path / "packed"
+    manifest = pack_corpus(training_path, packed_path, stop_words=FRENCH_STOPWORDS, dedup_threshold=threshold)
+    print(f"Rapports sources : {manifest['n_source_reports']}")
+    for report_type, info in manifest["types"].items():
+        print(f"  {report_type}: {info['n_reports']} rapports, {info['blob_bytes'] / 1024:.0f} Ko")
+    print(f"Corpus compacté sauvegardé : {packed_path}")
+    return manifest
+
+
+def export(folder: str = None):
+    """
+    Render the report texts of a folder to .docx files bundled in a zip archive.
+
+    Each .txt file holds one final report text, in the format produced by the
+    crew (TITRE:, Indication:, Technique:, ..., Conclusion:). Documents are
+    rendered in a process pool and streamed into generated/exports/.
+
+    Args:
+        folder: Folder of report texts. Defaults to knowledge/reports/testing.
+    """
+    print("## Export des Comptes Rendus")
+    print("-------------------------------")
+
+    project_root = Path(__file__).resolve().parent.parent.parent
+    reports_folder = Path(folder) if folder else project_root / "knowledge" / "reports" / "testing"
+    if not reports_folder.is_absolute():
+        reports_folder = project_root / reports_folder
+    report_files = sorted(reports_folder.glob("*.txt"))
+    if not report_files:
+        print(f"Erreur : Aucun compte rendu trouvé dans {reports_folder}")
+        sys.exit(1)
+    print(f"{len(report_files)} comptes rendus trouvés dans {reports_folder}")
+
+    def iter_reports():
+        # Read lazily: only the reports in flight are held in memory
+        for report_file in report_files:
+            text = report_file.read_text(encoding="utf-8")
+            yield f"{report_file.stem}.docx", parse_report_sections(text)
+
+    template_path = project_root / "templates" / "report_template.docx"
+    zip_path = project_root / "generated" / "exports" / datetime.now().strftime(
+        f"reports_{reports_folder.name}_%Y-%m-%d-%H-%M-%S.zip"
+    )
+    with ReportRenderer(template_path=str(template_path)) as renderer:
+        return renderer.export_zip(iter_reports(), zip_path)
 
 
 def replay():
@@ -469,8 +534,14 @@ def replay():
     print("Adjust the replay function based on CrewAI documentation.")
 
 
-def test():
-    """Test the crew execution with sample reports from the testing set."""
+def test(profile: bool = None):
+    """
+    Test the crew execution with sample reports from the testing set.
+
+    Args:
+        profile: If True, profile the run and write the profile next to the generated report.
+        Defaults to whether --profile is on the command line (for the test script).
+    """
     print("## Test du Générateur de Compte Rendu Médical")
     print("-------------------------------")
 
@@ -496,6 +567,13 @@ def test():
     selected_test_file = random.choice(test_files)
     print(f"\nFichier de test sélectionné : {selected_test_file.name}")
 
+    if profile is None:
+        profile = "--profile" in sys.argv[1:]
+    session = ProfileSession() if profile else None
+    if session is not None:
+        session.start()
+
+    status = None
     try:
         with open(selected_test_file, "r", encoding="utf-8") as f:
             ground_truth_report_text = f.read()
@@ -531,11 +609,14 @@ def test():
         print("-------------------------------")
 
         inputs = {"raw_input": prompt_input}
-        crew_generator = MedicalReportGenerator()
-        crew = crew_generator.crew()
+        with span("crew:setup"):
+            crew_generator = MedicalReportGenerator()
+            crew = crew_generator.crew()
+        instrument_crew(crew)
 
         print("\nDémarrage du processus de l'équipe pour le test...")
-        generated_report_text = str(crew.kickoff(inputs=inputs))
+        with span("crew:kickoff"):
+            generated_report_text = str(crew.kickoff(inputs=inputs))
         print("\nProcessus de l'équipe de test terminé.")
         print("\n## Texte du Compte Rendu Généré (Test):")
         print(generated_report_text)
@@ -546,7 +627,7 @@ def test():
         generated_report_filename_docx = output_test_reports_path / f"generated_{selected_test_file.stem}.docx"
         generated_report_filename_txt = output_test_reports_path / f"generated_{selected_test_file.stem}.txt"
 
-        create_word_document_from_template(
+        status = create_word_document_from_template(
             generated_report_text, 
             template_path=str(template_path),
             filename=str(generated_report_filename_docx)
@@ -571,6 +652,10 @@ def test():
         print(f"Erreur : Le fichier de test {selected_test_file} n'a pas été trouvé.")
     except Exception as e:
         print(f"\nUne erreur s'est produite lors de l'exécution du test : {type(e).__name__}: {e}", file=sys.stderr)
+    finally:
+        if session is not None:
+            # Next to the generated test report, or in generated/profiles/ if the test failed
+            _finish_profile(session, project_root, status, selected_test_file.stem)
 
 
 
@@ -578,19 +663,31 @@ def test():
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         command = sys.argv[1].lower()
+        options = [arg for arg in sys.argv[2:] if arg.startswith("--")]
+        arguments = [arg for arg in sys.argv[2:] if not arg.startswith("--")]
         if command == "run":
             # Check if input file is specified
-            input_file = sys.argv[2] if len(sys.argv) > 2 else None
-            run(input_file)
+            input_file = arguments[0] if arguments else None
+            run(input_file, profile="--profile" in options)
+        elif command == "watch":
+            # Optional number of workers
+            max_workers = int(arguments[0]) if arguments else 2
+            watch(max_workers)
         elif command == "train":
             train()
+        elif command == "dedup":
+            dedup(apply="--apply" in options)
+        elif command == "pack":
+            pack()
+        elif command == "export":
+            export(arguments[0] if arguments else None)
         elif command == "replay":
             replay()
         elif command == "test":
-            test()
+            test(profile="--profile" in options)
         else:
             print(f"Commande inconnue : {command}")
-            print("Commandes disponibles : run [input_file], test, train, replay")
+            print("Commandes disponibles : run [input_file] [--profile], watch [workers], test [--profile], train, dedup [--apply], pack, export [folder], replay")
     else:
         print("Aucune commande fournie. Exécution de la commande 'run' par défaut.")
         run()  # Default command
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Normalization of raw dictations before they are sent to the crew.
+
+`raw_input` is injected in several task prompts, so every token of noise is
+paid for more than once. `preprocess_dictation` repairs the encoding, strips
+speech-to-text artifacts (timestamps, speaker labels, filler words, spoken
+formatting commands), collapses repeated words, phrases and lines, normalizes
+whitespace, and can split long inputs into one chunk per examination.
+"""
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional
+
+# Bracketed timestamps anywhere, bare ones only at the start of a line
+_BRACKETED_TIMESTAMP = re.compile(r"[\[(]\s*\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d+)?\s*[\])]")
+_LEADING_TIMESTAMP = re.compile(r"(?m)^[ \t]*\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d+)?[ \t]*(?:-->[ \t]*\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d+)?)?[ \t]*[-–:]?[ \t]*")
+_SPEAKER_LABEL = re.compile(r"(?im)^[ \t]*(?:speaker|locuteur|intervenant|orateur)[ \t]*\d*[ \t]*:[ \t]*")
+_TRANSCRIPTION_TAGS = re.compile(
+    r"[\[(<]\s*(?:inaudible|incompréhensible|incomprehensible|bruit|noise|silence|pause|rires?|toux|musique|unk)\s*[\])>]",
+    re.IGNORECASE,
+)
+# All-caps tokens are left alone by _strip_filler: "HM" (hand motion) is clinical
+_FILLER_WORDS = re.compile(
+    r"(?<![\w'’-])(bon ben|e+u+h+|h+e+u+|h+u+m+|h+m{2,}|m+h+m+|b+a+h+|ben|hein)(?![\w'’-])[ \t]*,?",
+    re.IGNORECASE,
+)
+_SPOKEN_COMMANDS = [
+    (re.compile(r"\b(?:point|\.)[ \t]+à[ \t]+la[ \t]+ligne\b[ \t]*", re.IGNORECASE), ".\n"),
+    (re.compile(r"\b(?:nouveau|nouvel)[ \t]+paragraphe\b[ \t]*", re.IGNORECASE), "\n\n"),
+    # Bare "à la ligne" is also clinical wording ("par rapport à la ligne médiane"):
+    # it is a command only when a clause boundary or the end of the line follows
+    (re.compile(r"(?<![\w'’])à[ \t]+la[ \t]+ligne[ \t]*(?:[.,;][ \t]*|(?=\n)|\Z)", re.IGNORECASE), "\n"),
+    (re.compile(r"\bouvrez[ \t]+la[ \t]+parenthèse\b[ \t]*", re.IGNORECASE), "("),
+    (re.compile(r"[ \t]*\bfermez[ \t]+la[ \t]+parenthèse\b", re.IGNORECASE), ")"),
+]
+_REPEATED_WORD = re.compile(r"\b([^\W\d_]+)(?:[ \t]+\1\b)+", re.IGNORECASE)
+# Words whose doubling is grammatical in French ("nous nous sommes", "vous vous êtes")
+_GRAMMATICAL_REPEATS = {"nous", "vous"}
+_REPEATED_PHRASE = re.compile(r"\b((?:[^\W\d_]+[ \t,]+){1,5}[^\W\d_]+)(?:[ \t,]+\1\b)+", re.IGNORECASE)
+_INVISIBLE_CHARS = re.compile("[\\u200b-\\u200d\\u2060\\ufeff\\u00ad]")
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+# UTF-8 sequences decoded as cp1252: a lead byte (0xC2-0xEF) followed by continuation bytes
+_MOJIBAKE = re.compile("[{}][{}]+".format(
+    re.escape(bytes(range(0xC2, 0xF0)).decode("cp1252")),
+    re.escape(bytes(range(0x80, 0xC0)).decode("cp1252", errors="ignore")),
+))
+
+# Lines that open a new examination in a multi-exam dictation
+_EXAM_BOUNDARY = re.compile(
+    r"(?im)^[ \t]*(?:"
+    r"patient(?:e)?[ \t]+(?:de|âgée?)[ \t]+\d{1,3}[ \t]*ans"
+    r"|(?:examen|compte[ \t]+rendu)[ \t]*(?:n[°o]?[ \t]*)?\d+\b"
+    r"|(?:irm|angio-?irm|arthro-?irm|scanner|tdm|échographie|echographie|radiographie|mammographie)\b[^\n.]{0,60}:[ \t]*$"
+    r")"
+)
+# Lines of clinical information, which belong to the examination that follows
+_CLINICAL_INFORMATION = re.compile(
+    r"(?i)^[ \t]*(?:indications?|motif|renseignements?[ \t]+cliniques?|contexte|antécédents?|histoire[ \t]+clinique)\b"
+)
+
+
+@dataclass
+class PreprocessResult:
+    """Normalized text, its exam-level chunks and the token counts before and after."""
+
+    text: str
+    chunks: List[str] = field(default_factory=list)
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the number of LLM tokens of a text.
+
+    Uses tiktoken when it is installed (it is pulled in by crewAI), otherwise
+    counts words and punctuation marks.
+    """
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _repair_mojibake(match) -> str:
+    try:
+        return match.group(0).encode("cp1252").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return match.group(0)
+
+
+def normalize_encoding(text) -> str:
+    """Decode bytes, repair UTF-8 read as Latin-1/cp1252, and drop invisible characters."""
+    if isinstance(text, bytes):
+        try:
+            text = text.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            text = text.decode("cp1252", errors="replace")
+    text = _MOJIBAKE.sub(_repair_mojibake, text)
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = text.replace("\u00a0", " ").replace("\u202f", " ").replace("\u2019", "'")
+    text = _INVISIBLE_CHARS.sub("", text)
+    return _CONTROL_CHARS.sub(" ", text)
+
+
+def strip_dictation_artifacts(text: str) -> str:
+    """Remove timestamps, speaker labels, transcription tags, filler words and spoken commands."""
+    text = _BRACKETED_TIMESTAMP.sub(" ", text)
+    text = _LEADING_TIMESTAMP.sub("", text)
+    text = _SPEAKER_LABEL.sub("", text)
+    text = _TRANSCRIPTION_TAGS.sub(" ", text)
+    for pattern, replacement in _SPOKEN_COMMANDS:
+        text = pattern.sub(replacement, text)
+    return _FILLER_WORDS.sub(_strip_filler, text)
+
+
+def _strip_filler(match) -> str:
+    if match.group(1).isupper():
+        return match.group(0)
+    return " "
+
+
+def _collapse_word(match) -> str:
+    if match.group(1).casefold() in _GRAMMATICAL_REPEATS:
+        return match.group(0)
+    return match.group(1)
+
+
+def collapse_repetitions(text: str) -> str:
+    """Collapse immediately repeated words, phrases and lines ("le le foie", stutters, re-dictated lines)."""
+    text = _REPEATED_PHRASE.sub(r"\1", text)
+    text = _REPEATED_WORD.sub(_collapse_word, text)
+    lines = []
+    previous_key = None
+    for line in text.split("\n"):
+        key = re.sub(r"\W+", " ", line).strip().casefold()
+        if key and key == previous_key:
+            continue
+        lines.append(line)
+        if key:
+            previous_key = key
+    return "\n".join(lines)
+
+
+def normalize_whitespace(text: str) -> str:
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r" +([,.])", r"\1", text)
+    text = re.sub(r"([,.])(?:[ \t]*\1)+", r"\1", text)
+    text = re.sub(r"(?m)^[ ,]+|[ ]+$", "", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def _has_findings(chunk: str) -> bool:
+    """Whether a chunk holds more than exam headers, patient lines and clinical information."""
+    return any(
+        line.strip() and not _EXAM_BOUNDARY.match(line) and not _CLINICAL_INFORMATION.match(line)
+        for line in chunk.split("\n")
+    )
+
+
+def split_into_exams(text: str, max_tokens: int) -> List[str]:
+    """
+    Split a dictation into one chunk per examination if it exceeds `max_tokens`.
+
+    Chunks start at lines that open a new examination (e.g. "Patiente de 38 ans",
+    "Examen 2", "IRM du genou :"). A chunk without findings (a patient line or
+    an exam header followed by another boundary) is attached to the next one,
+    so splits only happen between complete examinations, and a single long
+    examination stays in one chunk.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    starts = [m.start() for m in _EXAM_BOUNDARY.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    chunks = [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    exams, pending = [], ""
+    for chunk in filter(None, chunks):
+        pending = f"{pending}\n{chunk}" if pending else chunk
+        if _has_findings(pending):
+            exams.append(pending)
+            pending = ""
+    if pending:
+        # Trailing headers without findings stay with the last examination
+        if exams:
+            exams[-1] = f"{exams[-1]}\n{pending}"
+        else:
+            exams.append(pending)
+    return exams or [text]
+
+
+def preprocess_dictation(text, max_chunk_tokens: Optional[int] = None) -> PreprocessResult:
+    """
+    Normalize a raw dictation and count the tokens saved.
+
+    Args:
+        text: Raw dictation (str or bytes).
+        max_chunk_tokens: If set, inputs longer than this are split into
+            exam-level chunks. Defaults to the MAX_INPUT_TOKENS environment
+            variable, if any.
+
+    Returns:
+        PreprocessResult: the cleaned text, its chunks and the token counts.
+    """
+    if max_chunk_tokens is None and os.environ.get("MAX_INPUT_TOKENS"):
+        max_chunk_tokens = int(os.environ["MAX_INPUT_TOKENS"])
+
+    tokens_before = count_tokens(text if isinstance(text, str) else text.decode("utf-8", errors="replace"))
+    decoded = normalize_encoding(text)
+    cleaned = strip_dictation_artifacts(decoded)
+    cleaned = normalize_whitespace(collapse_repetitions(normalize_whitespace(cleaned)))
+    chunks = split_into_exams(cleaned, max_chunk_tokens) if max_chunk_tokens else [cleaned]
+    return PreprocessResult(
+        text=cleaned,
+        chunks=chunks,
+        tokens_before=tokens_before,
+        tokens_after=count_tokens(cleaned),
+    )
@@ -0,0 +1,229 @@
+"""
+Profiling mode for a single report run (`run --profile`, `test --profile`).
+
+A `ProfileSession` combines:
+
+- cProfile on the calling thread, dumped as a `.prof` file (pstats, snakeviz);
+- a sampling profiler over all threads, written as folded stacks (`.folded`)
+  for flamegraph.pl, speedscope or inferno;
+- wall-time spans: one per crew task, per LLM call, and around the tool,
+  retrieval and document rendering stages (see `span`);
+- peak Python memory from tracemalloc.
+
+`write` saves these files plus a `.profile.txt` summary of the spans and the
+top-N hotspots. Spans are no-ops when no session is active, so the
+instrumentation can stay in the code paths.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_active_session: Optional["ProfileSession"] = None
+
+
+@contextmanager
+def span(name: str):
+    """Record the wall time of a block in the active profiling session, if any."""
+    session = _active_session
+    if session is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        session.add_span(name, start, time.time())
+
+
+def instrument_crew(crew):
+    """Record one span per task of `crew` in the active profiling session, if any."""
+    session = _active_session
+    if session is None:
+        return
+    session.mark_task_boundary()
+    for task in crew.tasks:
+        task.callback = _task_span_callback(session, task, task.callback)
+
+
+def _task_span_callback(session: "ProfileSession", task, original_callback):
+    name = getattr(task, "name", None) or (task.description or "").strip()[:40]
+
+    def callback(output):
+        # Sequential process: a task runs from the end of the previous one
+        end = time.time()
+        session.add_span(f"task:{name}", session.last_task_boundary, end)
+        session.last_task_boundary = end
+        if original_callback is not None:
+            return original_callback(output)
+
+    return callback
+
+
+class ProfileSession:
+    """
+    Collect a profile of everything run inside `with ProfileSession():`.
+
+    Args:
+        sample_interval: Period of the stack sampler, in seconds.
+        top_n: Number of hotspots listed in the summary.
+    """
+
+    def __init__(self, sample_interval: float = 0.005, top_n: int = 25):
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+        self.spans: List[tuple] = []
+        self.stacks: Counter = Counter()
+        self.n_samples = 0
+        self.peak_memory = 0
+        self.started_at = self.stopped_at = None
+        self.last_task_boundary = None
+        self._lock = threading.Lock()
+        self._profiler = cProfile.Profile()
+        self._stop_sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+        self._llm_callback = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        global _active_session
+        _active_session = self
+        self.started_at = self.last_task_boundary = time.time()
+        tracemalloc.start()
+        self._install_llm_callback()
+        self._sampler.start()
+        self._profiler.enable()
+
+    def stop(self):
+        global _active_session
+        self._profiler.disable()
+        self._stop_sampling.set()
+        self._sampler.join()
+        self._remove_llm_callback()
+        _, self.peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stopped_at = time.time()
+        _active_session = None
+
+    def add_span(self, name: str, start: float, end: float):
+        with self._lock:
+            self.spans.append((name, start, end, threading.current_thread().name))
+
+    def mark_task_boundary(self):
+        self.last_task_boundary = time.time()
+
+    def _install_llm_callback(self):
+        """Record LLM call durations through litellm's callbacks, when available."""
+        try:
+            import litellm
+        except ImportError:
+            return
+
+        def on_llm_call(kwargs, completion_response, start_time, end_time):
+            self.add_span(f"llm:{kwargs.get('model', 'unknown')}", start_time.timestamp(), end_time.timestamp())
+
+        self._llm_callback = on_llm_call
+        litellm.success_callback.append(on_llm_call)
+        litellm.failure_callback.append(on_llm_call)
+
+    def _remove_llm_callback(self):
+        if self._llm_callback is None:
+            return
+        import litellm
+        for callbacks in (litellm.success_callback, litellm.failure_callback):
+            if self._llm_callback in callbacks:
+                callbacks.remove(self._llm_callback)
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop_sampling.wait(self.sample_interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.n_samples += 1
+
+    def span_totals(self) -> Dict[str, dict]:
+        """Aggregate the spans by name: count, total and max wall time."""
+        totals: Dict[str, dict] = {}
+        for name, start, end, _ in self.spans:
+            entry = totals.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += end - start
+            entry["max"] = max(entry["max"], end - start)
+        return totals
+
+    def summary(self) -> str:
+        """Return the text summary: spans, peak memory and top-N hotspots."""
+        wall_time = (self.stopped_at or time.time()) - self.started_at
+        lines = [
+            "## Profil d'exécution",
+            f"Durée totale : {wall_time:.2f} s",
+            f"Mémoire Python maximale (tracemalloc) : {self.peak_memory / 1024 / 1024:.1f} Mo",
+            f"Échantillons : {self.n_samples} (intervalle {self.sample_interval * 1000:.0f} ms)",
+            "",
+            "## Étapes (temps mural)",
+            f"{'étape':<50} {'appels':>6} {'total (s)':>10} {'max (s)':>9} {'% total':>8}",
+        ]
+        for name, entry in sorted(self.span_totals().items(), key=lambda x: -x[1]["total"]):
+            share = 100 * entry["total"] / wall_time if wall_time else 0
+            lines.append(
+                f"{name[:50]:<50} {entry['count']:>6} {entry['total']:>10.3f} {entry['max']:>9.3f} {share:>7.1f}%"
+            )
+
+        # Self time per function from the sampler, across all threads
+        leaf_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        total_samples = sum(leaf_counts.values()) or 1
+        lines += ["", f"## Top {self.top_n} fonctions (échantillonnage, temps propre, tous threads)"]
+        for function, count in leaf_counts.most_common(self.top_n):
+            lines.append(f"{100 * count / total_samples:6.1f}%  {function}")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.top_n)
+        lines += ["", f"## Top {self.top_n} fonctions (cProfile, temps cumulé, thread principal)", stream.getvalue().strip()]
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_prefix: Path) -> List[Path]:
+        """
+        Write `<prefix>.profile.txt`, `<prefix>.folded` and `<prefix>.prof`.
+
+        Args:
+            output_prefix: Path without extension, e.g. the generated report path
+                without its `.docx` suffix.
+        """
+        output_prefix = Path(output_prefix)
+        output_prefix.parent.mkdir(parents=True, exist_ok=True)
+        summary_path = output_prefix.with_name(output_prefix.name + ".profile.txt")
+        folded_path = output_prefix.with_name(output_prefix.name + ".folded")
+        pstats_path = output_prefix.with_name(output_prefix.name + ".prof")
+
+        summary_path.write_text(self.summary(), encoding="utf-8")
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._profiler.dump_stats(str(pstats_path))
+        return [summary_path, folded_path, pstats_path]
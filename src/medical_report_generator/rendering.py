@@ -0,0 +1,425 @@
+"""
+Rendering of the final report text into Word documents.
+
+python-docx parsing, placeholder replacement and saving are CPU-bound, so
+`ReportRenderer` runs them in a process pool, away from the threads that
+orchestrate the crew. The pool uses the forkserver start method (spawn where
+it is unavailable): workers are never forked from the multi-threaded watcher
+process, which could deadlock on locks held by other threads.
+
+Documents are always written atomically (temporary file in the target folder,
+then rename), and many reports can be streamed into a single zip archive
+without holding them all in memory.
+"""
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from docx import Document
+from docx.shared import Pt
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
+from medical_report_generator.profiling import span
+
+
+def create_word_document_from_template(
+    report_text: str,
+    template_path: str = None,
+    filename: str = "radiology_report.docx",
+    renderer: Optional["ReportRenderer"] = None,
+):
+    """
+    Creates a Word document from the structured report text using a template.
+    
+    Args:
+        report_text: The complete structured report text (output from the crew).
+        template_path: Path to the template .docx file. If None, creates from scratch.
+        filename: The name of the output .docx file.
+        renderer: Optional process pool renderer. If None, renders in the current process.
+    """
+    # Parse the report text to extract sections
+    parsed_sections = parse_report_sections(report_text)
+
+    if renderer is not None:
+        return renderer.render_to_file(parsed_sections, template_path, filename).result()
+    return render_report_to_file(parsed_sections, template_path, filename)
+
+
+def build_document(sections: dict, template_path: str = None):
+    """
+    Build the python-docx document of a parsed report.
+
+    Args:
+        sections: Parsed sections, as returned by `parse_report_sections`.
+        template_path: Path to the template .docx file. If None, creates from scratch.
+    """
+    # Load template or create new document
+    if template_path and Path(template_path).exists():
+        print(f"Using template: {template_path}")
+        with span("render:load_template"):
+            document = Document(template_path)
+        # Method 1: Replace placeholders in template
+        with span("render:replace_placeholders"):
+            replace_template_placeholders(document, sections)
+    else:
+        print("Creating document from scratch (template not found or not specified)")
+        document = Document()
+        # Set default style
+        style = document.styles["Normal"] 
+        font = style.font
+        font.name = "Calibri"
+        font.size = Pt(11)
+        # Method 2: Build document from scratch (your original method)
+        with span("render:build_document"):
+            build_document_from_scratch(document, sections)
+    return document
+
+
+def render_report_bytes(sections: dict, template_path: str = None) -> bytes:
+    """Render a parsed report and return the .docx file content."""
+    buffer = io.BytesIO()
+    document = build_document(sections, template_path)
+    with span("render:save"):
+        document.save(buffer)
+    return buffer.getvalue()
+
+
+def write_atomic(data: bytes, filename) -> Path:
+    """
+    Write `data` to `filename` atomically.
+
+    The content goes to a temporary file in the same folder, which is then
+    renamed over the target, so readers never see a partially written file.
+    """
+    target = Path(filename)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        os.chmod(tmp_name, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    return target
+
+
+def render_report_to_file(sections: dict, template_path: str = None, filename: str = "radiology_report.docx") -> dict:
+    """Render a parsed report and save it atomically to `filename`."""
+    try:
+        write_atomic(render_report_bytes(sections, template_path), filename)
+        print(f"\nCompte rendu généré avec succès sous le nom '{filename}'")
+        return {"is_generated": True, "filename": str(filename)}
+    except Exception as e:
+        print(f"\nErreur lors de l'enregistrement du document : {e}")
+        return {"is_generated": False, "error": str(e)}
+
+
+def _pool_context():
+    """Start method of the rendering pool: forkserver on Unix, spawn otherwise."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Import the rendering code once in the server rather than in every worker
+        context.set_forkserver_preload(["__main__", __name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class ReportRenderer:
+    """
+    Process pool rendering parsed reports to .docx files or bytes.
+
+    Args:
+        max_workers: Number of rendering processes (defaults to the CPU count).
+        template_path: Default template used when none is given per report.
+    """
+
+    def __init__(self, max_workers: int = None, template_path: str = None):
+        self.template_path = template_path
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context())
+        self.max_workers = self._executor._max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def render_bytes(self, sections: dict, template_path: str = None) -> Future:
+        """Submit a report; the future resolves to the .docx content."""
+        return self._executor.submit(render_report_bytes, sections, template_path or self.template_path)
+
+    def render_to_file(self, sections: dict, template_path: str = None, filename: str = "radiology_report.docx") -> Future:
+        """Submit a report; the future resolves to the generation status dict."""
+        return self._executor.submit(
+            render_report_to_file, sections, template_path or self.template_path, str(filename)
+        )
+
+    def export_zip(self, reports: Iterable[Tuple[str, dict]], zip_path, max_pending: int = None) -> dict:
+        """
+        Render many reports into a single zip archive.
+
+        Reports are submitted lazily with at most `max_pending` in flight, and
+        each document is written to the archive as soon as it is rendered, so
+        memory use does not grow with the number of reports. The archive is
+        written to a temporary file and renamed once complete.
+
+        Args:
+            reports: Iterable of (name inside the archive, parsed sections).
+            zip_path: Destination of the .zip archive.
+            max_pending: Maximum number of reports rendered or buffered at once
+                (defaults to twice the number of workers).
+
+        Returns:
+            dict: Export status with the archive path and the number of reports.
+        """
+        max_pending = max_pending or 2 * self.max_workers
+        target = Path(zip_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        count = 0
+        try:
+            os.chmod(tmp_name, 0o644)
+            with os.fdopen(fd, "wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                pending = {}
+                report_iter = iter(reports)
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < max_pending:
+                        try:
+                            arcname, sections = next(report_iter)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        pending[self.render_bytes(sections)] = arcname
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        archive.writestr(pending.pop(future), future.result())
+                        count += 1
+            os.replace(tmp_name, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+        print(f"\n{count} comptes rendus exportés dans '{target}'")
+        return {"is_generated": True, "filename": str(target), "count": count}
+
+
+def parse_report_sections(report_text: str) -> dict:
+    """
+    Parse the report text and extract all sections.
+    
+    Args:
+        report_text: The complete structured report text
+        
+    Returns:
+        dict: Dictionary with section names as keys and content as values
+    """
+    # Clean up markdown code blocks
+    cleaned_text = re.sub(
+        r"^\s*```(?:json|text|french)?\s*[\r\n]*(.*?)\s*```\s*$",
+        r"\1",
+        report_text,
+        flags=re.DOTALL | re.IGNORECASE,
+    ).strip()
+
+    lines = cleaned_text.split("\n")
+    
+    # Extract title
+    title_content = "Compte Rendu Radiologique"
+    lines_for_sections = lines
+    
+    if lines:
+        first_line = lines[0].strip()
+        if first_line.upper().startswith("TITRE:"):
+            title_content = (
+                first_line.split(":", 1)[1].strip()
+                if ":" in first_line
+                else title_content
+            )
+            lines_for_sections = lines[1:]
+
+    # Parse sections
+    section_headers_list = [
+        "Indication:",
+        "Technique:", 
+        "Incidences:",
+        "Résultat:",
+        "Conclusion:",
+    ]
+    
+    sections = {"TITRE": title_content}
+    current_section_header = None
+    current_section_content = []
+
+    for line_idx, line_text in enumerate(lines_for_sections):
+        stripped_line = line_text.strip()
+        found_new_header = False
+        
+        for header in section_headers_list:
+            if stripped_line.upper().startswith(header.upper()):
+                if current_section_header:
+                    sections[current_section_header.rstrip(":")] = "\n".join(
+                        current_section_content
+                    ).strip()
+                current_section_header = header
+                current_section_content = [stripped_line[len(header):].strip()]
+                found_new_header = True
+                break
+                
+        if not found_new_header and current_section_header:
+            if stripped_line:
+                current_section_content.append(stripped_line)
+
+        if line_idx == len(lines_for_sections) - 1 and current_section_header:
+            sections[current_section_header.rstrip(":")] = "\n".join(
+                current_section_content
+            ).strip()
+
+    # Ensure all required sections exist
+    for header in section_headers_list:
+        section_name = header.rstrip(":")
+        if section_name not in sections:
+            sections[section_name] = ""
+
+    return sections
+
+
+def replace_template_placeholders(document, sections):
+    """
+    Replace placeholders in the template document with actual content.
+    
+    This method looks for placeholders like {{TITRE}}, {{Indication}}, etc.
+    and replaces them with the actual content.
+    """
+    # Get current date in French format
+    current_date = datetime.now().strftime("%A %d %B %Y")
+    # Define placeholder mappings - including all possible variations
+    placeholder_mappings = {
+        "{{DATE}}": current_date,
+        "{{ DATE }}": current_date,
+        "{{TITRE}}": sections.get("TITRE", "Compte Rendu Radiologique"),
+        "{{ TITRE }}": sections.get("TITRE", "Compte Rendu Radiologique"),
+        "{{Indication}}": sections.get("Indication", "Néant"),
+        "{{ Indication }}": sections.get("Indication", "Néant"),
+        "{{Technique}}": sections.get("Technique", "Néant"),
+        "{{ Technique }}": sections.get("Technique", "Néant"),
+        "{{Incidences}}": sections.get("Incidences", "Néant"),
+        "{{ Incidences }}": sections.get("Incidences", "Néant"),
+        "{{Résultat}}": sections.get("Résultat", "Néant"),
+        "{{ Résultat }}": sections.get("Résultat", "Néant"),
+        "{{Resultat}}": sections.get("Résultat", "Néant"),  # without accent
+        "{{ Resultat }}": sections.get("Résultat", "Néant"),  # without accent
+        "{{Conclusion}}": sections.get("Conclusion", "Néant"),
+        "{{ Conclusion }}": sections.get("Conclusion", "Néant"),
+        "{{Conclusions}}": sections.get("Conclusion", "Néant"),  # plural form
+        "{{ Conclusions }}": sections.get("Conclusion", "Néant"),  # plural form
+        "{{USER}}": "Medical Agent Reporter",  # plural form
+    }
+    
+    # Debug: Print available sections
+    print(f"\nDEBUG - Available sections: {list(sections.keys())}")
+    for key, value in sections.items():
+        print(f"  {key}: {value[:100]}..." if len(str(value)) > 100 else f"  {key}: {value}")
+    
+    # Function to replace text in paragraph while preserving formatting
+    def replace_in_paragraph(paragraph, placeholder, replacement):
+        if placeholder in paragraph.text:
+            print(f"DEBUG - Found placeholder '{placeholder}' in paragraph")
+            
+            # Method 1: Try to replace in individual runs first
+            replaced = False
+            for run in paragraph.runs:
+                if placeholder in run.text:
+                    run.text = run.text.replace(placeholder, replacement or "Néant")
+                    replaced = True
+                    print(f"DEBUG - Replaced '{placeholder}' in run")
+            
+            # Method 2: If not replaced in runs, rebuild paragraph
+            if not replaced and placeholder in paragraph.text:
+                print(f"DEBUG - Rebuilding paragraph for '{placeholder}'")
+                full_text = paragraph.text
+                new_text = full_text.replace(placeholder, replacement or "Néant")
+                
+                # Clear paragraph and add new text
+                paragraph.clear()
+                paragraph.add_run(new_text)
+    
+    # Replace placeholders in paragraphs
+    for paragraph in document.paragraphs:
+        original_text = paragraph.text
+        for placeholder, content in placeholder_mappings.items():
+            replace_in_paragraph(paragraph, placeholder, content)
+        
+        # Log if paragraph changed
+        if paragraph.text != original_text:
+            print(f"DEBUG - Paragraph changed from: '{original_text[:50]}...' to: '{paragraph.text[:50]}...'")
+    
+    # Replace placeholders in tables (if your template has tables)
+    for table in document.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    for placeholder, content in placeholder_mappings.items():
+                        replace_in_paragraph(paragraph, placeholder, content)
+
+    # Replace placeholders in headers and footers
+    for section in document.sections:
+        # Header
+        if section.header:
+            for paragraph in section.header.paragraphs:
+                for placeholder, content in placeholder_mappings.items():
+                    replace_in_paragraph(paragraph, placeholder, content)
+        
+        # Footer
+        if section.footer:
+            for paragraph in section.footer.paragraphs:
+                for placeholder, content in placeholder_mappings.items():
+                    replace_in_paragraph(paragraph, placeholder, content)
+
+
+def build_document_from_scratch(document, sections):
+    """
+    Build the document from scratch (original method).
+    """
+    # Add title
+    title_paragraph = document.add_paragraph(sections.get("TITRE", "Compte Rendu Radiologique"))
+    title_paragraph.style = document.styles["Heading 1"]
+    title_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    document.add_paragraph()  # Add a blank line after the title
+
+    # Add sections in order
+    section_headers_list = ["Indication", "Technique", "Incidences", "Résultat", "Conclusion"]
+    
+    for header in section_headers_list:
+        content = sections.get(header, "").strip()
+        paragraph = document.add_paragraph()
+        header_run = paragraph.add_run(f"{header}:")
+        header_run.bold = True
+        paragraph.add_run(" ")
+
+        if content and content != "-" and content.upper() != "NÉANT":
+            paragraph.add_run(content)
+        else:
+            paragraph.add_run("Néant")
+        document.add_paragraph()
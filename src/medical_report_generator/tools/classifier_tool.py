@@ -1,7 +1,11 @@
 from crewai.tools import BaseTool
-from typing import Type, ClassVar
+from typing import Type, ClassVar, Dict
+from pathlib import Path
 from pydantic import BaseModel, Field
 
+from medical_report_generator.profiling import span
+from medical_report_generator.training import DEFAULT_MODEL_PATH, load_report_classifier
+
 class ClassifyReportInput(BaseModel):
     """Input schema for classifying medical report type."""
     raw_input: str = Field(..., description="Le texte médical brut à classifier.")
@@ -15,9 +19,29 @@ class MedicalReportClassifierTool(BaseTool):
     )
     args_schema: Type[BaseModel] = ClassifyReportInput
     tool_name: ClassVar[str] = "determine_report_type"
+    # Modèle entraîné par la commande `train` ; mots-clés utilisés s’il est absent
+    model_path: Path = Field(default_factory=lambda: DEFAULT_MODEL_PATH)
+    min_confidence: float = Field(0.35, description="Probabilité minimale pour retenir la prédiction du modèle.")
+
+    def predict_proba(self, raw_input: str) -> Dict[str, float]:
+        """Probabilités calibrées par type de rapport ({} si aucun modèle n’est entraîné)."""
+        model = load_report_classifier(self.model_path)
+        if model is None:
+            return {}
+        return model.predict_proba_one(raw_input)
 
     def _run(self, raw_input: str) -> str:
         """Classifie le type de rapport médical basé sur le texte d’entrée."""
+        with span(f"tool:{self.name}"):
+            probabilities = self.predict_proba(raw_input)
+            if probabilities:
+                label, probability = max(probabilities.items(), key=lambda x: x[1])
+                if probability >= self.min_confidence:
+                    return label
+            return self._classify_by_keywords(raw_input)
+
+    def _classify_by_keywords(self, raw_input: str) -> str:
+        """Classification de repli par mots-clés."""
         report_type_keywords = {
             "irm_hepatique": ["foie", "hépatique", "liver", "hepatic", "biliaire", "cholangio-irm", "bili-irm"],
             "irm_genou": ["genou", "knee", "ménisque", "ménisques", "ligament croisé", "lca", "lcp", "tibia", "fémur"],
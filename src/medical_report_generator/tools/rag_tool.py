@@ -1,11 +1,18 @@
 from crewai.tools import BaseTool
 from typing import Type, List, Dict, Optional
-from pydantic import BaseModel, Field, PrivateAttr
-import os, re
+from pydantic import BaseModel, Field
+import os, re, threading
+import numpy as np
+from functools import lru_cache
 from pathlib import Path
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from medical_report_generator.corpus import iter_corpus_files, normalize_report_type, report_type_from_path
+from medical_report_generator.corpus_store import open_packed_corpus
+from medical_report_generator.profiling import span
+from medical_report_generator.dedup import find_near_duplicate_clusters
+
 FRENCH_STOPWORDS = [ ... ]  # inchangé
 
 class RetrieveReportsInput(BaseModel):
@@ -17,6 +24,85 @@ class RetrieveReportsInput(BaseModel):
     )
     top_k: int = Field(3, description="Nombre de rapports à renvoyer (par défaut 3).")
 
+
+def _read_report(path: Path, root: Path) -> Optional[Dict]:
+    """Lit un rapport de la base de connaissances."""
+    try:
+        content = path.read_text(encoding="utf-8").strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not content:
+        return None
+    return {
+        "name": str(path.relative_to(root)),
+        "path": str(path),
+        "report_type": report_type_from_path(path, root),
+        "content": content,
+    }
+
+
+class _ReportIndex:
+    """Rapports (dédupliqués) d’une base et leurs matrices TF-IDF, partagés par tous les outils."""
+
+    def __init__(self, reports: List[Dict]):
+        self.reports = reports
+        self._tfidf: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def tfidf(self, reports: List[Dict]):
+        """Vectoriseur et matrice TF-IDF d’un sous-ensemble de rapports, calculés une seule fois."""
+        key = tuple(r["path"] for r in reports)
+        with self._lock:
+            if key not in self._tfidf:
+                with span("rag:vectorize_corpus"):
+                    vectorizer = TfidfVectorizer(stop_words=FRENCH_STOPWORDS)
+                    matrix = vectorizer.fit_transform([r["content"] for r in reports])
+                self._tfidf[key] = (vectorizer, matrix)
+            return self._tfidf[key]
+
+
+@lru_cache(maxsize=4)
+def _load_report_index(root: str, mtimes: tuple, deduplicate: bool, dedup_threshold: float) -> _ReportIndex:
+    root = Path(root)
+    with span("rag:load_corpus"):
+        reports = [r for r in (_read_report(Path(path), root) for path, _ in mtimes) if r]
+    with span("rag:deduplicate"):
+        clusters = find_near_duplicate_clusters(
+            [r["content"] for r in reports],
+            groups=[r["report_type"] for r in reports],
+            threshold=dedup_threshold,
+        )
+    indexed = []
+    for cluster_id, members in enumerate(clusters):
+        for position, i in enumerate(members):
+            reports[i]["cluster_id"] = cluster_id
+            reports[i]["cluster_size"] = len(members)
+            if position == 0 or not deduplicate:
+                indexed.append(reports[i])
+    return _ReportIndex(indexed)
+
+
+_report_index_lock = threading.Lock()
+
+
+def get_report_index(root: Path, deduplicate: bool = True, dedup_threshold: float = 0.8) -> _ReportIndex:
+    """
+    Retourne l’index de la base `root`, construit une fois par processus.
+
+    L’index est partagé par toutes les instances de l’outil (chaque équipe en
+    crée plusieurs) et reconstruit seulement si des rapports sont ajoutés,
+    supprimés ou modifiés.
+    """
+    mtimes = []
+    for path in iter_corpus_files(root):
+        try:
+            mtimes.append((str(path), path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            continue
+    with _report_index_lock:
+        return _load_report_index(str(Path(root)), tuple(mtimes), deduplicate, dedup_threshold)
+
+
 class RAGMedicalReportsTool(BaseTool):
     name: str = "retrieve_similar_reports"
     description: str = (
@@ -24,15 +110,115 @@ class RAGMedicalReportsTool(BaseTool):
     )
     args_schema: Type[BaseModel] = RetrieveReportsInput
     knowledge_base_path: Path = Field(default_factory=lambda: Path("knowledge/reports/training"))
-    _vectorizer: TfidfVectorizer = PrivateAttr(default_factory=lambda: TfidfVectorizer(stop_words=FRENCH_STOPWORDS))
-    _reports_cache: dict = PrivateAttr(default_factory=dict)
+    # Corpus compacté (commande `pack`), par défaut `packed/` à côté de knowledge_base_path ;
+    # utilisé à la place de knowledge_base_path s’il a été construit à partir de ce dossier
+    packed_corpus_path: Optional[Path] = None
+    # Regroupe les quasi-doublons à la construction de l’index (MinHash/LSH)
+    deduplicate: bool = True
+    dedup_threshold: float = 0.8
 
     def __init__(self, knowledge_base_path: Optional[str] = None, **kwargs):
         super().__init__(**kwargs)
         if knowledge_base_path:
             self.knowledge_base_path = Path(knowledge_base_path)
 
-    # … (toutes les méthodes internes _read_report, _get_all_reports, etc. restent identiques) …
+    def _get_all_reports(self) -> List[Dict]:
+        """
+        Tous les rapports de la base, via l’index partagé du processus.
+
+        Les quasi-doublons sont regroupés en clusters : chaque rapport reçoit un
+        `cluster_id` et, si `deduplicate` est actif, seul le représentant de
+        chaque cluster est conservé, avec la taille du cluster (`cluster_size`).
+        """
+        return get_report_index(self.knowledge_base_path, self.deduplicate, self.dedup_threshold).reports
+
+    def _get_packed_corpus(self):
+        """Corpus compacté de knowledge_base_path, ou None s’il n’existe pas ou provient d’un autre dossier."""
+        packed_path = self.packed_corpus_path or self.knowledge_base_path.parent / "packed"
+        packed = open_packed_corpus(packed_path)
+        if packed is None:
+            return None
+        if Path(packed.manifest["source"]).resolve() != Path(self.knowledge_base_path).resolve():
+            return None
+        return packed
+
+    def _select_types(self, available_types, report_type: str) -> List[str]:
+        """Types correspondant au type demandé (correspondance exacte, sinon partielle)."""
+        wanted = normalize_report_type(report_type)
+        if wanted in available_types:
+            return [wanted]
+        if not wanted:
+            return []
+        return [t for t in available_types if wanted in t or t in wanted]
+
+    def _filter_reports_by_type(self, reports: List[Dict], report_type: str) -> List[Dict]:
+        """Garde les rapports du type demandé (correspondance exacte, sinon partielle)."""
+        types = set(self._select_types({r["report_type"] for r in reports}, report_type))
+        return [r for r in reports if r["report_type"] in types]
+
+    def _search_packed_corpus(self, packed, raw_input: str, report_type: str, top_k: int) -> List[Dict]:
+        """
+        Recherche dans le corpus compacté : les scores sont calculés sur les
+        matrices TF-IDF mappées en mémoire, seul le texte des résultats est décodé.
+        """
+        candidates = []
+        for selected_type in self._select_types(packed.report_types, report_type):
+            report_set = packed.get(selected_type)
+            with span("rag:similarity"):
+                scores = report_set.scores(raw_input)
+            best = np.argsort(-scores, kind="stable")[:top_k]
+            candidates.extend((float(scores[i]), report_set, int(i)) for i in best)
+        candidates.sort(key=lambda x: -x[0])
+
+        hits = []
+        for score, report_set, i in candidates:
+            record = report_set.meta[i]
+            hits.append({
+                "name": report_set.name(i),
+                "path": f"{report_set.report_type}/{i}",
+                "report_type": report_set.report_type,
+                "cluster_id": (report_set.report_type, int(record["cluster_id"])),
+                "cluster_size": int(record["cluster_size"]),
+                "similarity": score,
+                "content": None,
+                "_source": (report_set, i),
+            })
+        hits = self._diversify(hits, top_k)
+        for hit in hits:
+            report_set, i = hit.pop("_source")
+            hit["content"] = report_set.text(i)
+        return hits
+
+    def _calculate_similarity(self, query: str, reports: List[Dict]) -> List[Dict]:
+        """Trie les rapports par similarité cosinus TF-IDF avec la requête."""
+        index = get_report_index(self.knowledge_base_path, self.deduplicate, self.dedup_threshold)
+        vectorizer, matrix = index.tfidf(reports)
+        with span("rag:similarity"):
+            scores = cosine_similarity(vectorizer.transform([query]), matrix)[0]
+        ranked = sorted(zip(scores, range(len(reports))), key=lambda x: -x[0])
+        return [dict(reports[i], similarity=float(score)) for score, i in ranked]
+
+    def _diversify(self, ranked_reports: List[Dict], top_k: int) -> List[Dict]:
+        """Retourne au plus un rapport par cluster de quasi-doublons."""
+        selected, seen_clusters = [], set()
+        for rpt in ranked_reports:
+            cluster_id = rpt.get("cluster_id", rpt["path"])
+            if cluster_id in seen_clusters:
+                continue
+            seen_clusters.add(cluster_id)
+            selected.append(rpt)
+            if len(selected) == top_k:
+                break
+        return selected
+
+    def _format_report_for_output(self, rpt: Dict) -> str:
+        """Formate un rapport pour la réponse de l’outil."""
+        header = f"Fichier: {rpt['name']} | Type: {rpt['report_type']}"
+        if "similarity" in rpt:
+            header += f" | Similarité: {rpt['similarity']:.2f}"
+        if rpt.get("cluster_size", 1) > 1:
+            header += f" | Représente {rpt['cluster_size']} rapports quasi identiques"
+        return f"{header}\n{rpt['content']}"
 
     def _run(self, raw_input: str, report_type: str, top_k: int = 3) -> str:
         """
@@ -40,13 +226,23 @@ class RAGMedicalReportsTool(BaseTool):
         report_type: le type de rapport issu de la tâche précédente
         top_k      : nombre maximum de rapports à retourner
         """
+        with span(f"tool:{self.name}"):
+            return self._retrieve(raw_input, report_type, top_k)
+
+    def _retrieve(self, raw_input: str, report_type: str, top_k: int) -> str:
         # Utilisez raw_input comme query
-        all_reports      = self._get_all_reports()
-        filtered_reports = self._filter_reports_by_type(all_reports, report_type)
-        if not filtered_reports:
+        packed = self._get_packed_corpus()
+        if packed is not None:
+            top = self._search_packed_corpus(packed, raw_input, report_type, top_k)
+        else:
+            all_reports      = self._get_all_reports()
+            filtered_reports = self._filter_reports_by_type(all_reports, report_type)
+            top = []
+            if filtered_reports:
+                similar = self._calculate_similarity(raw_input, filtered_reports)
+                top     = self._diversify(similar, top_k)
+        if not top:
             return f"Aucun rapport pour le type « {report_type} »."
-        similar = self._calculate_similarity(raw_input, filtered_reports)
-        top     = similar[:top_k]
 
         # formatage identique à avant
         output = [f"Retrieved {len(top)} similar reports for input."]
@@ -0,0 +1,181 @@
+"""
+Offline training of the report type classifier.
+
+The model is a word TF-IDF and logistic regression pipeline fitted on
+`knowledge/reports/training`. The regularisation strength is selected by
+cross-validation on the log loss, which keeps the probabilities well
+calibrated, and the grid search runs on all CPU cores. Classes are not
+reweighted: the probabilities keep the class frequencies of the corpus, which
+the confidence threshold of the classifier tool relies on.
+
+The fitted pipeline is exported as a `CompactReportClassifier`: vocabulary,
+idf weights and coefficients only, scored with a few numpy operations so that
+a classification takes microseconds instead of going through sklearn's
+per-call validation.
+"""
+import math
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from medical_report_generator.corpus import count_by_type, load_labeled_corpus
+
+DEFAULT_MODEL_PATH = Path("knowledge/models/report_classifier.joblib")
+
+
+def build_classifier_pipeline() -> Pipeline:
+    """Return the untrained TF-IDF + logistic regression pipeline."""
+    return Pipeline([
+        ("tfidf", TfidfVectorizer(
+            lowercase=True, strip_accents="unicode", ngram_range=(1, 2),
+            min_df=1, sublinear_tf=True, dtype=np.float32,
+        )),
+        ("classifier", LogisticRegression(max_iter=2000)),
+    ])
+
+
+class CompactReportClassifier:
+    """Linear classifier exported from a fitted pipeline, for fast single-text scoring."""
+
+    def __init__(self, pipeline: Pipeline):
+        vectorizer = pipeline.named_steps["tfidf"]
+        classifier = pipeline.named_steps["classifier"]
+        self.classes_ = [str(c) for c in classifier.classes_]
+        # Tokenization settings only: the vocabulary and idf are stored below
+        self.analyzer_params = clone(vectorizer).get_params()
+        self.vocabulary = {term: int(i) for term, i in vectorizer.vocabulary_.items()}
+        self.idf = vectorizer.idf_.astype(np.float32)
+        # (n_features, n_outputs) so that the rows of a document's terms can be gathered
+        self.coef = np.ascontiguousarray(classifier.coef_.T, dtype=np.float32)
+        self.intercept = classifier.intercept_.astype(np.float32)
+        self._analyzer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_analyzer"] = None
+        return state
+
+    def predict_proba_one(self, text: str) -> Dict[str, float]:
+        """Return the class probabilities of a single text."""
+        if self._analyzer is None:
+            self._analyzer = TfidfVectorizer(**self.analyzer_params).build_analyzer()
+        counts = Counter(
+            self.vocabulary[term] for term in self._analyzer(text) if term in self.vocabulary
+        )
+        decision = self.intercept
+        if counts:
+            ids = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+            weights = np.fromiter(
+                (1.0 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts)
+            ) * self.idf[ids]
+            weights /= np.linalg.norm(weights)
+            decision = decision + weights @ self.coef[ids]
+        if len(self.classes_) == 2:
+            positive = 1.0 / (1.0 + math.exp(-float(decision[0])))
+            probabilities = [1.0 - positive, positive]
+        else:
+            exp = np.exp(decision - decision.max())
+            probabilities = (exp / exp.sum()).tolist()
+        return dict(zip(self.classes_, probabilities))
+
+    def predict(self, texts) -> list:
+        return [max(p.items(), key=lambda x: x[1])[0] for p in map(self.predict_proba_one, texts)]
+
+
+def train_report_classifier(
+    training_path: Path,
+    model_path: Path = DEFAULT_MODEL_PATH,
+    testing_path: Optional[Path] = None,
+    n_jobs: int = -1,
+) -> dict:
+    """
+    Fit the classifier on a labeled corpus and serialize it to `model_path`.
+
+    Args:
+        training_path: Folder of labeled training reports.
+        model_path: Destination of the serialized model.
+        testing_path: Optional folder of labeled reports used to report accuracy.
+        n_jobs: Number of cores for the cross-validated search (-1 = all).
+
+    Returns:
+        dict: Training summary (labels, sizes, chosen C, test accuracy if any).
+    """
+    texts, labels, _ = load_labeled_corpus(training_path)
+    counts = count_by_type(labels)
+    if len(counts) < 2:
+        raise ValueError(
+            f"Au moins deux types de rapport sont nécessaires pour l'entraînement, trouvés : {counts}"
+        )
+
+    pipeline = build_classifier_pipeline()
+    min_class_count = min(counts.values())
+    started = time.perf_counter()
+    if min_class_count >= 2:
+        search = GridSearchCV(
+            pipeline,
+            {"classifier__C": [0.5, 2.0, 8.0, 32.0]},
+            scoring="neg_log_loss",
+            cv=StratifiedKFold(n_splits=min(5, min_class_count), shuffle=True, random_state=0),
+            n_jobs=n_jobs,
+        )
+        search.fit(texts, labels)
+        model = search.best_estimator_
+        best_c = search.best_params_["classifier__C"]
+    else:
+        # Not enough samples per class for cross-validation
+        model = pipeline.fit(texts, labels)
+        best_c = model.named_steps["classifier"].C
+    training_seconds = time.perf_counter() - started
+
+    compact_model = CompactReportClassifier(model)
+    model_path = Path(model_path)
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(compact_model, model_path)
+    _load_model.cache_clear()
+
+    summary = {
+        "labels": counts,
+        "n_train": len(texts),
+        "C": best_c,
+        "training_seconds": round(training_seconds, 2),
+        "model_path": str(model_path),
+    }
+
+    if testing_path is not None:
+        test_texts, test_labels, _ = load_labeled_corpus(testing_path)
+        if test_texts:
+            predictions = compact_model.predict(test_texts)
+            summary["n_test"] = len(test_texts)
+            summary["test_accuracy"] = accuracy_score(test_labels, predictions)
+            summary["test_report"] = classification_report(test_labels, predictions, zero_division=0)
+    return summary
+
+
+@lru_cache(maxsize=4)
+def _load_model(model_path: str, mtime_ns: int):
+    return joblib.load(model_path)
+
+
+def load_report_classifier(model_path: Path = DEFAULT_MODEL_PATH):
+    """
+    Return the trained classifier, or None if it has not been trained yet.
+
+    The model is loaded once per process and reloaded only if the file changes.
+    """
+    model_path = Path(model_path)
+    try:
+        mtime_ns = model_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _load_model(str(model_path.resolve()), mtime_ns)
@@ -0,0 +1,317 @@
+"""
+Directory watcher that turns dictations dropped into `input_data/` into reports.
+
+New `.txt` files are detected with inotify when available (Linux), or by
+polling the folder otherwise. A file is only dispatched once its size and
+modification time have been stable for a settle delay, so partially written
+dictations are never picked up. Each file is processed by a bounded worker
+pool running the regular crew pipeline, then moved to `done/` or `failed/`.
+A small JSON state file records processed inputs (by file name and content
+hash) so restarts skip them. SIGTERM stops the watcher like Ctrl+C, after the
+reports in progress are finished.
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import shutil
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+_INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+STATE_FILE_NAME = ".watch_state.json"
+
+
+class InotifyWatch:
+    """Minimal inotify binding over ctypes; raises OSError when unavailable."""
+
+    def __init__(self, directory: Path):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify n'est disponible que sous Linux")
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc introuvable")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 a échoué")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self._fd, os.fsencode(str(directory)), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, "inotify_add_watch a échoué")
+
+    def wait(self, timeout: float) -> list:
+        """Block up to `timeout` seconds and return the names of changed files."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + _INOTIFY_EVENT_HEADER.size <= len(data):
+            _, _, _, length = _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class WatchState:
+    """
+    Persistent record of processed inputs, keyed by file name and content hash.
+
+    The name is part of the key: two dictations with the same text (e.g. a
+    templated normal exam for two patients) are distinct inputs.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if path.exists():
+            try:
+                self._entries = json.loads(path.read_text(encoding="utf-8")).get("processed", {})
+            except (OSError, ValueError) as e:
+                print(f"Avertissement : fichier d'état illisible ({e}), il sera recréé.")
+
+    @staticmethod
+    def key(name: str, digest: str) -> str:
+        return f"{name}:{digest}"
+
+    def is_processed(self, name: str, digest: str) -> bool:
+        """Failed inputs are not considered processed, so they can be dropped again."""
+        with self._lock:
+            return self._entries.get(self.key(name, digest), {}).get("status") == "done"
+
+    def record(self, name: str, digest: str, entry: dict):
+        with self._lock:
+            self._entries[self.key(name, digest)] = entry
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(
+                json.dumps({"processed": self._entries}, ensure_ascii=False, indent=2),
+                encoding="utf-8",
+            )
+            os.replace(tmp_path, self.path)
+
+
+def file_digest(path: Path) -> str:
+    """Return the SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _move_unique(source: Path, target_dir: Path) -> Path:
+    """Move `source` into `target_dir`, suffixing the name if it already exists."""
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / source.name
+    if target.exists():
+        stamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        target = target_dir / f"{source.stem}_{stamp}{source.suffix}"
+    shutil.move(str(source), str(target))
+    return target
+
+
+class DictationWatcher:
+    """
+    Watch a folder and process each settled `.txt` file with `process_file`.
+
+    Args:
+        input_dir: Folder receiving the dictations.
+        process_file: Callable taking the input path and returning a status dict
+            (as `generate_report` does); exceptions mark the file as failed.
+        max_workers: Size of the worker pool; at most this many files are in flight.
+        settle_seconds: Time a file must stay unchanged before being dispatched.
+        poll_interval: Scan interval used when inotify is unavailable, and as a
+            safety rescan period otherwise.
+        use_inotify: Set to False to force the polling backend.
+    """
+
+    def __init__(
+        self,
+        input_dir: Path,
+        process_file: Callable[[Path], dict],
+        max_workers: int = 2,
+        settle_seconds: float = 2.0,
+        poll_interval: float = 5.0,
+        use_inotify: bool = True,
+    ):
+        self.input_dir = Path(input_dir)
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.done_dir = self.input_dir / "done"
+        self.failed_dir = self.input_dir / "failed"
+        self.process_file = process_file
+        self.max_workers = max(1, max_workers)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.state = WatchState(self.input_dir / STATE_FILE_NAME)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dictation")
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        # name -> (size, mtime_ns, first time this signature was seen)
+        self._pending: Dict[str, tuple] = {}
+        self._stop = threading.Event()
+
+        self._inotify: Optional[InotifyWatch] = None
+        if use_inotify:
+            try:
+                self._inotify = InotifyWatch(self.input_dir)
+            except OSError as e:
+                print(f"inotify indisponible ({e}), surveillance par scrutation toutes les {poll_interval}s.")
+
+    def stop(self):
+        self._stop.set()
+
+    def serve_forever(self):
+        """Run the watch loop until `stop()` is called, Ctrl+C is pressed or SIGTERM is received."""
+        backend = "inotify" if self._inotify else "scrutation"
+        print(f"Surveillance de {self.input_dir} ({backend}, {self.max_workers} worker(s))...")
+
+        # Signal handlers can only be installed from the main thread
+        handles_sigterm = threading.current_thread() is threading.main_thread()
+        if handles_sigterm:
+            previous_handler = signal.signal(signal.SIGTERM, self._handle_sigterm)
+
+        self._scan()
+        last_scan = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                # Wake up early enough to dispatch files that are settling
+                timeout = self.settle_seconds if self._pending else self.poll_interval
+                if self._inotify:
+                    for name in self._inotify.wait(timeout):
+                        self._observe(self.input_dir / name)
+                else:
+                    self._stop.wait(min(timeout, self.poll_interval))
+                if not self._inotify or time.monotonic() - last_scan >= self.poll_interval:
+                    self._scan()
+                    last_scan = time.monotonic()
+                self._dispatch_settled()
+        except KeyboardInterrupt:
+            print("\nArrêt demandé, attente des traitements en cours...")
+        finally:
+            self._executor.shutdown(wait=True)
+            if self._inotify:
+                self._inotify.close()
+            if handles_sigterm:
+                signal.signal(signal.SIGTERM, previous_handler or signal.SIG_DFL)
+
+    def _handle_sigterm(self, signum, frame):
+        print("\nSIGTERM reçu, attente des traitements en cours...")
+        self.stop()
+
+    def _scan(self):
+        for path in self.input_dir.glob("*.txt"):
+            self._observe(path)
+
+    def _observe(self, path: Path):
+        if path.suffix.lower() != ".txt" or path.parent != self.input_dir:
+            return
+        with self._in_flight_lock:
+            if path.name in self._in_flight:
+                return
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(path.name, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self._pending.get(path.name)
+        if previous is None or previous[:2] != signature:
+            self._pending[path.name] = (*signature, time.monotonic())
+
+    def _dispatch_settled(self):
+        now = time.monotonic()
+        for name, (size, mtime_ns, seen_at) in list(self._pending.items()):
+            path = self.input_dir / name
+            if now - seen_at < self.settle_seconds:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[name] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if size == 0:
+                continue
+            # Bounded pool: keep the file pending until a worker slot frees up
+            if not self._slots.acquire(blocking=False):
+                return
+            del self._pending[name]
+            with self._in_flight_lock:
+                self._in_flight.add(name)
+            self._executor.submit(self._process, path)
+
+    def _process(self, path: Path):
+        try:
+            digest = file_digest(path)
+            if self.state.is_processed(path.name, digest):
+                print(f"{path.name} déjà traité, déplacé vers {self.done_dir.name}/.")
+                _move_unique(path, self.done_dir)
+                return
+
+            started = datetime.now()
+            print(f"Traitement de {path.name}...")
+            try:
+                status = self.process_file(path) or {}
+                succeeded = bool(status.get("is_generated"))
+                error = status.get("error")
+            except Exception as e:
+                status, succeeded, error = {}, False, f"{type(e).__name__}: {e}"
+
+            # Record the outcome before moving the input: if the process dies in
+            # between, the next start moves the file without generating it again
+            entry = {
+                "input_file": path.name,
+                "moved_to": None,
+                "status": "done" if succeeded else "failed",
+                "report": status.get("filenames", status.get("filename")),
+                "error": error,
+                "started_at": started.isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self.state.record(path.name, digest, entry)
+            target = _move_unique(path, self.done_dir if succeeded else self.failed_dir)
+            self.state.record(path.name, digest, dict(entry, moved_to=str(target.relative_to(self.input_dir))))
+            if succeeded:
+                print(f"{path.name} traité : {status.get('filenames', status.get('filename'))}")
+            else:
+                print(f"Échec du traitement de {path.name} : {error}", file=sys.stderr)
+        except Exception as e:
+            print(f"Erreur inattendue sur {path.name} : {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(path.name)
+            self._slots.release()